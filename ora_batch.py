@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import importlib
+from ora_shared import shared_instance
+
+# Batch entry point: streams requests from a JSONL file through OracleSearch with
+# bounded concurrency and streams the answers back out as JSONL.
+#
+#   python ora_batch.py requests.jsonl results.jsonl --variant system --concurrency 8
+#
+# Each input line is a JSON object. {"question": "..."} is sent as free text, any other
+# object (minus an optional "id") is sent as the structured system payload.
+# Completed line numbers are appended to a checkpoint file, so re-running the same
+# command after an interruption only processes what is missing.
+
+VARIANTS = {"qna": "ora_search_qna", "system": "ora_search_system"}
+
+
+def to_question(request):
+    if "question" in request:
+        return str(request["question"])
+    return json.dumps({key: value for key, value in request.items() if key != "id"})
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {int(line) for line in f if line.strip()}
+
+
+async def run_one(searcher, line_no, line):
+    started = time.perf_counter()
+    record = {"line": line_no, "id": line_no, "result": None, "error": None}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        record["id"] = request.get("id", line_no)
+        record["result"] = await searcher.executeQueryAsync(to_question(request))
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+
+async def run_batch(searcher, input_path, output_path, concurrency=8, order="input", checkpoint_path=None):
+    checkpoint_path = checkpoint_path or output_path + ".ckpt"
+    done = read_checkpoint(checkpoint_path)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    # Caps how far completed results may run ahead of the oldest pending one in input order
+    window = asyncio.Semaphore(concurrency * 4)
+    pending = {}
+    next_line = [0]
+    stats = {"ok": 0, "failed": 0, "skipped": len(done)}
+
+    with open(output_path, 'a') as output, open(checkpoint_path, 'a') as checkpoint:
+
+        def write(record):
+            output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+            checkpoint.write(f"{record['line']}\n")
+            checkpoint.flush()
+            stats["failed" if record["error"] else "ok"] += 1
+            window.release()
+
+        def flush_in_order():
+            while True:
+                if next_line[0] in done:
+                    next_line[0] += 1
+                elif next_line[0] in pending:
+                    write(pending.pop(next_line[0]))
+                    next_line[0] += 1
+                else:
+                    break
+
+        async def produce():
+            with open(input_path) as f:
+                for line_no, line in enumerate(f):
+                    if line_no in done:
+                        continue
+                    if not line.strip():
+                        done.add(line_no)
+                        continue
+                    await window.acquire()
+                    await queue.put((line_no, line))
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                record = await run_one(searcher, *item)
+                if order == "input":
+                    pending[record["line"]] = record
+                    flush_in_order()
+                else:
+                    write(record)
+
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+        if order == "input":
+            flush_in_order()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requests through OracleSearch")
+    parser.add_argument("input", help="JSONL file with one request per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="system")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get('ORA_BATCH_CONCURRENCY', 8)))
+    parser.add_argument("--order", choices=["input", "completion"], default="input")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.ckpt)")
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(VARIANTS[args.variant])
+    searcher = shared_instance(VARIANTS[args.variant], module.OracleSearch)
+    started = time.perf_counter()
+    stats = asyncio.run(run_batch(searcher, args.input, args.output, args.concurrency, args.order, args.checkpoint))
+    print(f"Done in {time.perf_counter() - started:.1f}s: {stats}", file=sys.stderr)
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import importlib
+import threading
+import tracemalloc
+from contextlib import closing, redirect_stdout
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from sqlalchemy import create_engine
+from ora_schema import SchemaRegistry
+import ora_shared
+
+# Offline benchmark and replay harness.
+# Builds a SQLite fixture of RATES/CLIENT/DEAL/TRADE with generated data, swaps the
+# OpenAI model for a scripted chat model that replays recorded tool-call sequences,
+# and pushes a question workload through OracleSearch at the requested concurrency.
+# Throughput, latency percentiles, LLM calls and peak Python memory are compared
+# against bench/baseline.json.
+#
+#   python ora_bench.py --scale 200 --requests 500 --concurrency 16
+#   python ora_bench.py --update-baseline
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench")
+CURRENCIES = ["USD", "EUR", "GBP", "JPY", "HKD"]
+COUNTRIES = ["US", "GB", "DE", "JP", "HK"]
+REGIONS = ["NAM", "EMEA", "EMEA", "APAC", "APAC"]
+PRODUCTS = ["EQ", "FI", "FX", "ETF"]
+AREAS = ["CASH", "PT", "ALGO"]
+
+
+def _sqlite_type(oracle_type):
+    oracle_type = oracle_type.upper()
+    if oracle_type.startswith(("NUMBER", "FLOAT")):
+        return "NUMERIC"
+    return "TEXT"
+
+
+def build_fixture(path, scale, seed=7):
+    """Creates the four tables from the QnA Table_Relationships and fills them with
+    scale clients, 3 deals per client, 2 rates and 10 trades per deal."""
+    from ora_search_qna import TABLE_RELATIONSHIPS
+
+    registry = SchemaRegistry(TABLE_RELATIONSHIPS)
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    with closing(sqlite3.connect(path)) as connection:
+        for table, columns in registry.tables.items():
+            names = []
+            definitions = []
+            for name, _, type_ in columns:
+                if name not in names:
+                    names.append(name)
+                    definitions.append(f"{name} {_sqlite_type(type_)}")
+            connection.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+
+        def stamp():
+            return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"
+
+        clients, deals, rates, trades = [], [], [], []
+        for client_id in range(1, scale + 1):
+            clients.append((client_id, f"{client_id:06d}", f"CLIENT{client_id}", 1, "bench", stamp()))
+            for d in range(3):
+                deal_id = client_id * 10 + d
+                market = rng.randrange(len(CURRENCIES))
+                deals.append((deal_id, f"D{deal_id}", 1, client_id, 1, CURRENCIES[market], "bench", stamp()))
+                for r in range(2):
+                    rate_id = deal_id * 10 + r
+                    rates.append((rate_id, deal_id, r + 1, rng.choice(PRODUCTS), CURRENCIES[market], COUNTRIES[market],
+                                  rng.choice(["cps", "bps"]), REGIONS[market], rng.choice(["B", "S"]),
+                                  rng.choice(["cps", "bps"]), rng.randint(1, 20), 1, stamp()))
+                for t in range(10):
+                    trades.append((len(trades) + 1, deal_id, rates[-1][0], rng.choice(PRODUCTS), CURRENCIES[market], COUNTRIES[market],
+                                   rng.choice(AREAS), REGIONS[market], client_id, rng.randint(1, 500),
+                                   rng.choice(["B", "S"]), rng.randint(100, 100000),
+                                   rng.choice([-1, 1, 2, 3, 5, 8]), "bench", stamp()))
+
+        connection.executemany(
+            "INSERT INTO CLIENT (CLIENT_ID, GP_NUM, CLIENT_NAME, PAYMENT_FREQUENCY, LAST_MODIFIED_USER, LAST_UPDATE_TIME) "
+            "VALUES (?, ?, ?, ?, ?, ?)", clients)
+        connection.executemany(
+            "INSERT INTO DEAL (DEAL_ID, DEAL_MNC, DEAL_TYPE, CLIENT_ID, STATUS, CURRENCY, LAST_MODIFIED_USER, LAST_UPDATE_TIME) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", deals)
+        connection.executemany(
+            "INSERT INTO RATES (RATE_ID, DEAL_ID, PRIORITY, PRODUCT_TYPE, CURRENCY, COUNTRY, CMSN_TYPE, REGION, SIDE, "
+            "EXEC_TYPE, EXEC_FEE, STATUS, LAST_UPDATE_TIME) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rates)
+        connection.executemany(
+            "INSERT INTO TRADE (TRADE_ID, DEAL_ID, RATE_ID, PRODUCT_TYPE, CURRENCY, COUNTRY, TRADE_AREA, REGION, GP_NUM, PRICE, "
+            "SIDE, QUANTITY, HARD_CODED_RATE, LAST_UPDATE_USER, LAST_UPDATE_TIME) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", trades)
+        connection.commit()
+    return path
+
+
+def use_fixture(path):
+    """Routes ora_shared (engine, SQLDatabase and raw connections) to the SQLite fixture."""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    ora_shared.configure(
+        engine,
+        lambda: closing(sqlite3.connect(path, check_same_thread=False)),
+        "sqlite",
+    )
+
+
+def sample_values(path, count, seed=11):
+    """Value sets for the workload placeholders, taken from real fixture rows."""
+    rng = random.Random(seed)
+    with closing(sqlite3.connect(path)) as connection:
+        rows = connection.execute(
+            "SELECT C.CLIENT_NAME, T.CURRENCY, T.COUNTRY, T.SIDE, T.PRODUCT_TYPE, T.REGION, T.TRADE_AREA "
+            "FROM TRADE T JOIN DEAL D ON T.DEAL_ID = D.DEAL_ID JOIN CLIENT C ON D.CLIENT_ID = C.CLIENT_ID").fetchall()
+    values = []
+    for row in rng.sample(rows, min(count, len(rows))):
+        client, currency, country, side, product, region, area = row
+        values.append({
+            "client": client.lower(), "CLIENT": client, "currency": currency.lower(), "CURRENCY": currency,
+            "country": country, "side": side, "product_type": product, "region": region, "trade_area": area,
+        })
+    return values
+
+
+def _fill(value, values):
+    if isinstance(value, str):
+        return value.format_map(values)
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, values) for item in value]
+    return value
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model stand-in that replays a recorded sequence of AI turns per question.
+
+    scripts maps the question text to a list of turns ({"tool_calls": [...]} or
+    {"content": "..."}); the turn played is the number of AI messages already in the
+    conversation. latency simulates the model's response time in seconds.
+    """
+
+    scripts: dict
+    latency: float = 0.0
+    calls: int = 0
+    lock: object = None
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        question = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+        turn = sum(1 for m in messages if isinstance(m, AIMessage))
+        script = self.scripts.get(question, [])
+        step = script[turn] if turn < len(script) else {"content": "No scripted answer."}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+        tool_calls = [
+            {"name": call["name"], "args": call["args"], "id": f"call_{turn}_{index}"}
+            for index, call in enumerate(step.get("tool_calls", []))
+        ]
+        message = AIMessage(content=step.get("content", ""), tool_calls=tool_calls)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(json.dumps(step)) // 4}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": usage})
+
+
+def build_requests(workload, values, count, seed=13):
+    """Expands workload entries with fixture values into (question, script) pairs."""
+    rng = random.Random(seed)
+    requests = []
+    for index in range(count):
+        entry = workload[index % len(workload)]
+        filled = _fill(entry, rng.choice(values))
+        question = filled["question"] if "question" in filled else json.dumps(filled["payload"])
+        requests.append((question, filled.get("script", [])))
+    return requests
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def replay(searcher, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(question):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await searcher.executeQueryAsync(question)
+            except Exception as e:
+                errors += 1
+                print(f"Error: {e}", file=sys.stderr)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(question) for question, _ in requests))
+    return time.perf_counter() - started, latencies, errors
+
+
+def run_scenario(variant, workload, values, args, workdir):
+    os.environ['ORA_TEMPLATE_STORE'] = os.path.join(workdir, f"templates_{variant}.json")
+    requests = build_requests(workload, values, args.requests)
+    model = ScriptedChatModel(scripts=dict(requests), latency=args.llm_latency_ms / 1000, lock=threading.Lock())
+    module = importlib.import_module(f"ora_search_{variant}")
+    searcher = module.OracleSearch(llm=model)
+
+    tracemalloc.start()
+    # The agent path pretty-prints every message; keep the report readable
+    with open(os.devnull, 'w') as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+        elapsed, latencies, errors = asyncio.run(replay(searcher, requests, args.concurrency))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "requests": len(requests),
+        "errors": errors,
+        "throughput_rps": round(len(requests) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "llm_calls": model.calls,
+        "peak_mem_mb": round(peak / 2**20, 2),
+    }
+
+
+# Metric -> True when higher is better
+DIRECTIONS = {"throughput_rps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+              "llm_calls": False, "peak_mem_mb": False}
+
+
+def compare(results, baseline, tolerance):
+    """Prints results next to the baseline; returns the list of regressions."""
+    regressions = []
+    for scenario, result in results.items():
+        print(f"\n{scenario}")
+        for metric, value in result.items():
+            base = baseline.get(scenario, {}).get(metric)
+            line = f"  {metric:<15} {value:>12}"
+            if base is not None and metric in DIRECTIONS:
+                change = (value - base) / base if base else 0.0
+                worse = -change if DIRECTIONS[metric] else change
+                flag = "  REGRESSION" if worse > tolerance else ""
+                line += f"   baseline {base:>12} ({change:+.1%}){flag}"
+                if flag:
+                    regressions.append(f"{scenario}.{metric}")
+            print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline OracleSearch benchmark")
+    parser.add_argument("--scale", type=int, default=200, help="number of generated clients")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--distinct", type=int, default=50, help="distinct value sets in the workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--scenarios", default="qna,system")
+    parser.add_argument("--workload", default=os.path.join(BENCH_DIR, "workload.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's console output")
+    args = parser.parse_args(argv)
+
+    with open(args.workload) as f:
+        workloads = json.load(f)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Keep every side effect of the run inside the temporary directory
+        os.environ['ORA_SCHEMA_SNAPSHOT'] = os.path.join(workdir, "schema.json")
+        os.environ['ORA_TRACE_LOG'] = os.path.join(workdir, "traces.jsonl")
+        os.environ.pop('ORA_CACHE_DB', None)
+        path = build_fixture(os.path.join(workdir, "fixture.db"), args.scale)
+        use_fixture(path)
+        values = sample_values(path, args.distinct)
+        results = {
+            variant: run_scenario(variant, workloads[variant], values, args, workdir)
+            for variant in args.scenarios.split(",")
+        }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
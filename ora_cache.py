@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from ora_shared import get_connection, get_dialect
+from ora_trace import span
+
+# Answer cache for OracleSearch.executeQuery.
+# Tier 1 is an in-process LRU, tier 2 an optional SQLite file shared between processes
+# (ORA_CACHE_DB). Every entry carries the data watermark it was computed against and
+# is discarded once the newest LAST_UPDATE_TIME on CLIENT/DEAL/TRADE moves past it.
+
+WATERMARK_QUERIES = {
+    "oracle": """SELECT GREATEST(
+    NVL((SELECT MAX(LAST_UPDATE_TIME) FROM CLIENT), DATE '1970-01-01'),
+    NVL((SELECT MAX(LAST_UPDATE_TIME) FROM DEAL), DATE '1970-01-01'),
+    NVL((SELECT MAX(LAST_UPDATE_TIME) FROM TRADE), DATE '1970-01-01'))
+FROM DUAL""",
+    "sqlite": """SELECT MAX(
+    IFNULL((SELECT MAX(LAST_UPDATE_TIME) FROM CLIENT), ''),
+    IFNULL((SELECT MAX(LAST_UPDATE_TIME) FROM DEAL), ''),
+    IFNULL((SELECT MAX(LAST_UPDATE_TIME) FROM TRADE), ''))""",
+}
+
+
+def normalize_question(question):
+    """Builds the cache key text: JSON objects with sorted keys and trimmed uppercase
+    values, free text lowercased with whitespace collapsed."""
+    try:
+        payload = json.loads(question)
+    except (TypeError, ValueError):
+        payload = None
+    if isinstance(payload, dict):
+        payload = {
+            key.strip().lower(): str(value).strip().upper()
+            for key, value in payload.items()
+            if value is not None and str(value).strip() != ""
+        }
+        return json.dumps(payload, sort_keys=True)
+    return " ".join(str(question).lower().split())
+
+
+class DataWatermark:
+    """Polls the newest LAST_UPDATE_TIME at most once per interval.
+
+    One caller runs the query while the others keep getting the previous value, so a
+    poll never makes concurrent cache lookups wait for the database."""
+
+    def __init__(self, interval=None):
+        self.interval = float(interval if interval is not None else os.environ.get('ORA_CACHE_WATERMARK_INTERVAL', 30))
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked = 0.0
+        self._polling = False
+
+    def _poll(self):
+        try:
+            with span("db.watermark"), get_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(WATERMARK_QUERIES[get_dialect()])
+                return str(cursor.fetchone()[0])
+        except Exception as e:
+            print(f"Error: cache watermark check failed: {e}")
+            return None
+
+    def current(self):
+        with self._lock:
+            due = not self._polling and (self._value is None or time.monotonic() - self._checked >= self.interval)
+            if not due:
+                return self._value
+            self._polling = True
+        value = self._poll()
+        with self._lock:
+            self._value = value
+            self._checked = time.monotonic()
+            self._polling = False
+        return value
+
+
+class AnswerCache:
+
+    def __init__(self, namespace, max_entries=None, max_chars=None, ttl=None, path=None, watermark=None):
+        self.namespace = namespace
+        self.max_entries = int(max_entries if max_entries is not None else os.environ.get('ORA_CACHE_MAX_ENTRIES', 1024))
+        self.max_chars = int(max_chars if max_chars is not None else os.environ.get('ORA_CACHE_MAX_CHARS', 4_000_000))
+        self.ttl = float(ttl if ttl is not None else os.environ.get('ORA_CACHE_TTL', 900))
+        self.watermark = watermark or DataWatermark()
+        # _lock guards the in-memory LRU only; SQLite I/O happens under _db_lock
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._watermark = None
+
+        path = path or os.environ.get('ORA_CACHE_DB')
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT, watermark TEXT, expires REAL)")
+            self._db.commit()
+
+    def _key(self, question):
+        return f"{self.namespace}:{normalize_question(question)}"
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._chars -= len(entry[0])
+
+    def _sync_watermark(self, watermark):
+        # Called with _lock held; the watermark itself is read before taking the lock
+        if watermark != self._watermark:
+            # Data changed (or is unknown): nothing held in memory is trustworthy any more
+            self._entries.clear()
+            self._chars = 0
+            self._watermark = watermark
+
+    def get(self, question):
+        key = self._key(question)
+        now = time.time()
+        watermark = self.watermark.current()
+        if watermark is None:
+            return None
+        with self._lock:
+            self._sync_watermark(watermark)
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, entry_watermark, expires = entry
+                if expires > now and entry_watermark == watermark:
+                    self._entries.move_to_end(key)
+                    return answer
+                self._drop(key)
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT answer, watermark, expires FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            answer, entry_watermark, expires = row
+            if expires <= now or entry_watermark != watermark:
+                self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        with self._lock:
+            self._store(key, answer, watermark, expires)
+        return answer
+
+    def version(self):
+        """Data watermark to read before computing an answer and pass to put()."""
+        return self.watermark.current()
+
+    def put(self, question, answer, version):
+        """Stores an answer computed from the data at version. When the data changed
+        while it was computed the answer may be stale, so it is not stored."""
+        if not isinstance(answer, str) or len(answer) > self.max_chars:
+            return
+        key = self._key(question)
+        expires = time.time() + self.ttl
+        watermark = self.watermark.current()
+        if watermark is None or watermark != version:
+            return
+        with self._lock:
+            self._sync_watermark(watermark)
+            self._store(key, answer, watermark, expires)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, watermark, expires) VALUES (?, ?, ?, ?)",
+                    (key, answer, watermark, expires))
+                self._db.commit()
+
+    def _store(self, key, answer, watermark, expires):
+        self._drop(key)
+        self._entries[key] = (answer, watermark, expires)
+        self._chars += len(answer)
+        while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._chars = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answers WHERE key LIKE ?", (f"{self.namespace}:%",))
+                self._db.commit()
@@ -0,0 +1,123 @@
+import os
+import json
+from ora_shared import get_connection, limit_clause
+from ora_trace import span
+from ora_snapshot import get_snapshot
+
+# Compiles the structured rate request received by ora_search_system straight into a
+# parameterized query, so the common case needs no LLM round trip at all.
+# Each payload key maps to (column expression, value kind). Text columns are compared
+# in uppercase, as the agent prompt asks for.
+RATE_FIELDS = {
+    "client": ("UPPER(C.CLIENT_NAME)", "text"),
+    "product_type": ("UPPER(T.PRODUCT_TYPE)", "text"),
+    "currency": ("UPPER(T.CURRENCY)", "text"),
+    "country": ("UPPER(T.COUNTRY)", "text"),
+    "trade_area": ("UPPER(T.TRADE_AREA)", "text"),
+    "region": ("UPPER(T.REGION)", "text"),
+    "gp_num": ("T.GP_NUM", "number"),
+    "price": ("T.PRICE", "number"),
+    "side": ("UPPER(T.SIDE)", "side"),
+    "quantity": ("T.QUANTITY", "number"),
+}
+
+SIDES = {"B": "B", "BUY": "B", "S": "S", "SELL": "S"}
+
+RATE_QUERY = """SELECT T.HARD_CODED_RATE, T.COUNTRY, T.CURRENCY, T.SIDE, T.LAST_UPDATE_USER, T.LAST_UPDATE_TIME
+FROM TRADE T
+JOIN DEAL D ON T.DEAL_ID = D.DEAL_ID
+JOIN CLIENT C ON D.CLIENT_ID = C.CLIENT_ID
+WHERE T.HARD_CODED_RATE <> -1"""
+
+RESPONSE_KEYS = ("rate", "country", "currency", "side", "user", "last_update_time")
+
+
+def parse_payload(payload):
+    """Returns the request as a dict, or None when it is not a JSON object."""
+    if isinstance(payload, dict):
+        return payload
+    try:
+        payload = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _bind_value(kind, value):
+    if isinstance(value, (dict, list, bool)):
+        raise ValueError(f"unsupported value {value!r}")
+    if kind == "number":
+        return float(value) if "." in str(value) else int(value)
+    value = str(value).strip().upper()
+    if kind == "side":
+        return SIDES[value]
+    return value
+
+
+def _max_rows():
+    return int(os.environ.get('ORA_RATE_MAX_ROWS', 50))
+
+
+def compile_rate_request(payload):
+    """Maps a structured rate request to (sql, binds).
+
+    Returns None when the payload cannot be compiled (not a JSON object, unknown keys,
+    non-numeric numbers or no criteria at all); the caller then falls back to the agent.
+    """
+    request = parse_payload(payload)
+    if request is None:
+        return None
+    if set(request) - set(RATE_FIELDS):
+        return None
+
+    conditions = []
+    binds = {}
+    for key, (column, kind) in RATE_FIELDS.items():
+        value = request.get(key)
+        if value is None or str(value).strip() == "":
+            continue
+        try:
+            binds[key] = _bind_value(kind, value)
+        except (KeyError, ValueError):
+            return None
+        conditions.append(f"{column} = :{key}")
+    if not conditions:
+        return None
+
+    sql = RATE_QUERY + "".join(f"\nAND {condition}" for condition in conditions)
+    # Oracle sorts NULLs first on DESC; NULLS LAST and the TRADE_ID tie-break give the
+    # same rows as the rate snapshot once the limit applies
+    sql += f"\nORDER BY T.LAST_UPDATE_TIME DESC NULLS LAST, T.TRADE_ID DESC\n{limit_clause(_max_rows())}"
+    return sql, binds
+
+
+def format_rates(rows):
+    """Renders rows in the JSON response format the system prompt asks the agent for."""
+    if not rows:
+        return json.dumps([{"message": "No results found"}])
+    return json.dumps([dict(zip(RESPONSE_KEYS, row)) for row in rows], default=str)
+
+
+def lookup_rates(payload):
+    """Answers a structured rate request from the rate snapshot when it is enabled and
+    loaded, otherwise with a single database round trip.
+
+    Returns the JSON response string, or None if the payload has to go to the agent.
+    """
+    compiled = compile_rate_request(payload)
+    if compiled is None:
+        return None
+    sql, binds = compiled
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        with span("snapshot.rate_lookup") as attrs:
+            rows = snapshot.lookup(binds, _max_rows())
+            attrs["rows"] = len(rows) if rows is not None else None
+        if rows is not None:
+            return format_rates(rows)
+    with span("db.rate_lookup") as attrs, get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql, binds)
+        rows = cursor.fetchall()
+        attrs["rows"] = len(rows)
+    return format_rates(rows)
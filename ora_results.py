@@ -0,0 +1,136 @@
+import os
+import re
+import csv
+from langchain_core.tools import tool
+from ora_shared import get_connection, limit_clause
+from ora_trace import span
+
+# Bounded result handling between the database and the LLM.
+# The toolkit's sql_db_query tool fetches the whole result set and hands all of it to
+# the model. The replacement below enforces the row limit on the server, fetches in
+# one tuned round trip and gives the model a compact summary. Full results are
+# streamed to the caller separately with fetchmany (stream_query / export_csv).
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def bounded_sql(sql, max_rows):
+    """Wraps a query so the database stops after max_rows + 1 rows (the extra row tells
+    us whether the result was cut off)."""
+    sql = sql.strip().rstrip(";").strip()
+    return f"SELECT * FROM (\n{sql}\n) {limit_clause(max_rows + 1)}"
+
+
+def _tune(cursor, rows):
+    # prefetchrows is specific to oracledb cursors
+    if hasattr(cursor, "prefetchrows"):
+        cursor.prefetchrows = rows + 1
+    cursor.arraysize = rows
+
+
+def run_bounded(sql, binds=None, max_rows=None):
+    """Returns (columns, rows, truncated) for at most max_rows rows."""
+    max_rows = max_rows or _env_int('ORA_TOOL_MAX_ROWS', 20)
+    with span("db.query") as attrs, get_connection() as connection:
+        cursor = connection.cursor()
+        # Everything we are going to read arrives with the execute round trip
+        _tune(cursor, max_rows + 1)
+        try:
+            cursor.execute(bounded_sql(sql, max_rows), binds or {})
+        except Exception as e:
+            # ORA-00918: the query selects duplicate column names, which cannot be wrapped.
+            # Running it unwrapped would drop the row limit, so ask for aliases instead
+            if "ORA-00918" not in str(e):
+                raise
+            raise RuntimeError(
+                f"{e}. The query selects several columns with the same name; give them unique "
+                f"aliases (e.g. T.STATUS AS TRADE_STATUS, D.STATUS AS DEAL_STATUS) and run it again") from e
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+        attrs["rows"] = len(rows)
+    return columns, rows[:max_rows], len(rows) > max_rows
+
+
+def summarize(columns, rows, truncated, max_chars=None, max_value_chars=80):
+    """Compact, size-capped text rendering of a result for the model."""
+    max_chars = max_chars or _env_int('ORA_TOOL_MAX_CHARS', 4000)
+    if not rows:
+        return "No rows returned."
+
+    def cell(value):
+        text = str(value)
+        return text if len(text) <= max_value_chars else text[:max_value_chars - 3] + "..."
+
+    lines = [" | ".join(columns)]
+    size = len(lines[0])
+    shown = 0
+    for row in rows:
+        line = " | ".join(cell(value) for value in row)
+        if size + len(line) + 1 > max_chars:
+            truncated = True
+            break
+        lines.append(line)
+        size += len(line) + 1
+        shown += 1
+    if truncated:
+        lines.append(f"(first {shown} rows shown; the result has more rows. Aggregate or filter further if you need them.)")
+    return "\n".join(lines)
+
+
+def make_query_tool(max_rows=None, validator=None):
+    """Drop-in replacement for the toolkit's sql_db_query tool. validator (an
+    ora_validate.SqlValidator) checks each query before it is sent to the database."""
+
+    @tool("sql_db_query")
+    def sql_db_query(query: str) -> str:
+        """Input to this tool is a detailed and correct SQL query, output is a result from the database.
+        At most a limited number of rows is returned; if more exist you are told so.
+        If the query is not correct, an error message will be returned.
+        Queries are checked against the known tables, columns and joins before they run.
+        If an error is returned, rewrite the query, check the query, and try again."""
+        if not re.match(r"\s*(SELECT|WITH)\b", query, re.IGNORECASE):
+            return "Error: only SELECT statements can be run."
+        if validator is not None:
+            with span("validate") as attrs:
+                problems = validator.validate(query)
+                attrs["problems"] = len(problems)
+            if problems:
+                return "Error: the query was not run: " + "; ".join(problems)
+        try:
+            return summarize(*run_bounded(query, max_rows=max_rows))
+        except Exception as e:
+            return f"Error: {e}"
+
+    return sql_db_query
+
+
+def stream_query(sql, binds=None, chunk_size=None):
+    """Yields (columns, rows) chunks of the full result; memory stays at one chunk."""
+    chunk_size = chunk_size or _env_int('ORA_STREAM_CHUNK_ROWS', 1000)
+    sql = sql.strip().rstrip(";")
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        _tune(cursor, chunk_size)
+        cursor.execute(sql, binds or {})
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+
+
+def export_csv(sql, path, binds=None, chunk_size=None):
+    """Streams the full result of sql into a CSV file and returns the row count."""
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for columns, rows in stream_query(sql, binds, chunk_size):
+            if count == 0:
+                writer.writerow(columns)
+            writer.writerows(rows)
+            count += len(rows)
+    return count
@@ -0,0 +1,169 @@
+import os
+import re
+from collections import deque
+from functools import lru_cache
+
+# Schema registry used to prune the Table_Relationships section of SQL_PREFIX.
+# It is built once from the Table_Relationships text and keeps a keyword index over
+# table names, column names and column descriptions. For each question only the
+# tables it mentions or whose columns it refers to, plus the tables needed to join
+# them, are rendered into the prompt. Selected tables keep all their columns: the
+# columns that hold the question's values (client name, currency, ...) are rarely
+# named in it. Tables that are only there to join the others are rendered with just
+# their join key columns.
+
+TABLE_PATTERN = re.compile(r"table:\s*(\w+)\s*=\s*\[(.*)\]")
+COLUMN_PATTERN = re.compile(r'"Column Name":"(.*?)","Description":"(.*?)","Type":"(.*?)"')
+RELATIONSHIP_PATTERN = re.compile(r"Relationship\s*:\s*(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)")
+
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "what", "which", "show", "list", "give", "all",
+    "are", "was", "were", "is", "of", "in", "on", "to", "by", "me", "id", "refers", "table",
+    "column", "has", "have", "how", "many", "much", "that", "this", "their", "there",
+}
+
+
+def tokenize(text):
+    """Lowercase word tokens with a naive plural strip, e.g. 'Trades' -> 'trade'."""
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", str(text).lower()):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.add(word)
+    return tokens
+
+
+class SchemaRegistry:
+
+    def __init__(self, relationships_text, always=()):
+        """always lists the tables that are in every prompt."""
+        self.tables = {}
+        self.relationships = []
+        self.always = {table.upper() for table in always}
+        for line in relationships_text.splitlines():
+            table = TABLE_PATTERN.search(line)
+            if table:
+                self.tables[table.group(1).upper()] = COLUMN_PATTERN.findall(table.group(2))
+                continue
+            relationship = RELATIONSHIP_PATTERN.search(line)
+            if relationship:
+                left, left_col, right, right_col = (part.upper() for part in relationship.groups())
+                self.relationships.append((left, left_col, right, right_col))
+
+        self.table_index = {}
+        self.column_index = {}
+        for table, columns in self.tables.items():
+            for token in tokenize(table.replace("_", " ")):
+                self.table_index.setdefault(token, set()).add(table)
+            for name, description, _ in columns:
+                for token in tokenize(name.replace("_", " ")) | tokenize(description):
+                    self.column_index.setdefault(token, set()).add((table, name))
+
+        self.graph = {table: set() for table in self.tables}
+        for left, _, right, _ in self.relationships:
+            if left in self.graph and right in self.graph:
+                self.graph[left].add(right)
+                self.graph[right].add(left)
+        # Per-instance cache, keyed on the pruning switch as well as the question
+        self._render = lru_cache(maxsize=1024)(self._render_uncached)
+
+    def _path(self, start, goal):
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            table = queue.popleft()
+            if table == goal:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path
+            for neighbour in sorted(self.graph[table]):
+                if neighbour not in previous:
+                    previous[neighbour] = table
+                    queue.append(neighbour)
+        return []
+
+    def select(self, question):
+        """Returns the names of the tables relevant to the question, in schema order."""
+        tokens = tokenize(question)
+        named = set(self.always)
+        for token in tokens:
+            named |= self.table_index.get(token, set())
+        # Words that name a table ("rates", "client") or match a column of a named table
+        # ("currency" on TRADE) say nothing about other tables
+        hits = {}
+        for token in tokens - set(self.table_index):
+            matches = self.column_index.get(token, ())
+            if any(table in named for table, _ in matches):
+                continue
+            for table, column in matches:
+                hits.setdefault(table, set()).add(token)
+
+        # Add the table most of the remaining words point at, e.g. "research fee" -> RATES.
+        # A tie is only taken on two or more words each, so one generic word ("active")
+        # that several descriptions share does not pull in every table
+        unnamed = {table: len(words) for table, words in hits.items() if table not in named}
+        if unnamed:
+            best = max(unnamed.values())
+            top = {table for table, score in unnamed.items() if score == best}
+            if len(top) == 1 or best >= 2:
+                named |= top
+        if not named:
+            return list(self.tables)
+        return [table for table in self.tables if table in named]
+
+    def join_tables(self, tables):
+        """Tables needed to join the given ones that are not among them."""
+        selected = set()
+        ordered = sorted(tables)
+        for other in ordered[1:]:
+            selected.update(self._path(ordered[0], other))
+        return [table for table in self.tables if table in selected and table not in tables]
+
+    def _key_columns(self, table):
+        keys = set()
+        for left, left_col, right, right_col in self.relationships:
+            if left == table:
+                keys.add(left_col)
+            if right == table:
+                keys.add(right_col)
+        return keys
+
+    def _render_table(self, table, only=None):
+        entries = [
+            f'("Column Name":"{name}","Description":"{description}","Type":"{type_}")'
+            for name, description, type_ in self.tables[table]
+            if only is None or name.upper() in only
+        ]
+        return f"table: {table} = [{','.join(entries)}]"
+
+    def render(self, question):
+        """Table_Relationships section for one question."""
+        return self._render(question, os.environ.get('ORA_SCHEMA_PRUNING', '1') != '0')
+
+    def _render_uncached(self, question, pruning):
+        if pruning:
+            named = self.select(question)
+            joins = self.join_tables(named)
+        else:
+            named, joins = list(self.tables), []
+        selection = [table for table in self.tables if table in named or table in joins]
+        lines = ["Table_Relationships"]
+        lines += [
+            self._render_table(table, self._key_columns(table) if table in joins else None)
+            for table in selection
+        ]
+        lines += [
+            f"Relationship : {left}.{left_col} = {right}.{right_col}"
+            for left, left_col, right, right_col in self.relationships
+            if left in selection and right in selection
+        ]
+        others = [table for table in self.tables if table not in selection]
+        if others:
+            lines.append(f"Only the relevant tables are listed; use sql_db_schema for the other tables: {', '.join(others)}")
+        if joins:
+            lines.append(f"Only the join columns are listed for: {', '.join(joins)}; use sql_db_schema for their other columns")
+        return "\n".join(lines)
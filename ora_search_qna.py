@@ -1,66 +1,66 @@
 import streamlit as st
 import os
-import oracledb
+import asyncio
+import threading
+import time
 from dotenv import load_dotenv
-from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine
-from sqlalchemy import text
 from langchain_openai import ChatOpenAI
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_core.messages import SystemMessage
 from langchain_core.messages import HumanMessage
+from langchain_core.messages import ToolMessage
 from langgraph.prebuilt import create_react_agent
+from ora_shared import get_database, shared_instance
+from ora_trace import trace_request, span, annotate, start_metrics_server
+from ora_schema import SchemaRegistry
+from ora_validate import SqlValidator
+from ora_cache import AnswerCache
+from ora_results import make_query_tool, stream_query
+from ora_templates import TemplateStore, extract_final_query, format_table
+
+TABLE_RELATIONSHIPS = """table: RATES = [("Column Name":"RATE_ID","Description":"Rate Id","Type":"NUMBER"),("Column Name":"DEAL_ID","Description":"Deal Id refers to table DEAL and column DEAL_ID","Type":"NUMBER(22,0)"),("Column Name":"PRIORITY","Description":"Priority (1 is highest)","Type":"NUMBER(22,0)"),("Column Name":"PRODUCT_TYPE","Description":"Product Type","Type":"VARCHAR2(10 BYTE)"),("Column Name":"SUB_PRODUCT_TYPE","Description":"Product Sub type","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"COUNTRY","Description":"Country  Code","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CMSN_TYPE","Description":"Commission Type (cps=cents per share, bps=basis points)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CMSN_MIN","Description":"Minimum Commission","Type":"NUMBER(22,0)"),("Column Name":"CMSN_MAX","Description":"Maximum Commission","Type":"NUMBER(22,0)"),("Column Name":"TRADE_AREA","Description":"Trade Area","Type":"VARCHAR2(20 BYTE)"),("Column Name":"REGION","Description":"Region (NAM=North America,EMEA=EUROPE,APAC=Asiapac,UK=United Kingdom)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"GP_NUM","Description":"Grandparent number","Type":"VARCHAR2(10 BYTE)"),("Column Name":"PRICE_MIN","Description":"Minimum Price","Type":"NUMBER(22,0)",("Column Name":"PRICE_MAX","Description":"Maximum Price","Type":"NUMBER(22,0)"),("Column Name":"SIDE","Description":"Side (S=Sell, B=Buy)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"QUANTITY_MIN","Description":"Minimum Quantity","Type":"NUMBER(22,0)"),("Column Name":"QUANTTITY_MAX","Description":"Maximum Quantity","Type":"NUMBER(22,0)"),("Column Name":"RSCH_TYPE","Description":"Research Fee Type (cps=cents per share, bps=basis points, rate=1 indicates 100%)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"RSCH_FEE","Description":"Research Fee","Type":"NUMBER(22,0)"),("Column Name":"EXEC_TYPE","Description":"Execution Fee Type (cps=cents per share, bps=basis points)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"EXEC_FEE","Description":"Execution Fee","Type":"NUMBER(22,0)"),("Column Name":"BEGIN_DATE","Description":"Effective from","Type":"DATE"),("Column Name":"END_DATE","Description":"Effective till","Type":"DATE"),("Column Name":"STATUS","Description":"Status (1 is active, > 1 is not active)","Type":"NUMBER(22,0)"),("Column Name":"COMMENTS","Description":"User comments","Type":"VARCHAR2(255 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated time","Type":"TIMESTAMP(6)"),("Column Name":"LAST_UPDATE_USER","Description":"Last Updated user","Type":"VARCHAR2(255 BYTE)")]
+table: CLIENT = [("Column Name":"CLIENT_ID","Description":"Client ID ","Type":"NUMBER"),("Column Name":"GP_NUM","Description":"Grandparent Number","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CLIENT_NAME","Description":"Client Name","Type":"VARCHAR2(10 BYTE)"),("Column Name":"PAYMENT_FREQUENCY","Description":"Payment Frequency (1=Monthly,2=Yearly)","Type":"NUMBER"),("Column Name":"LAST_MODIFIED_USER","Description":"Last Updated time","Type":"VARCHAR2(20 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated user","Type":"TIMESTAMP(6)")]
+table: DEAL = [("Column Name":"DEAL_ID","Description":"Deal Id","Type":"NUMBER"),("Column Name":"DEAL_MNC","Description":"Deal Mnemonic","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEAL_TYPE","Description":"Deal Type(1=Regular,4=Classic,2=Partial,3=Full)","Type":"NUMBER(3,0)"),("Column Name":"CLIENT_ID","Description":"Client Id refers to the table CLIENT and column CLIENT_ID","Type":"NUMBER(10,0)"),("Column Name":"STATUS","Description":"Status (1 is active, > 1 is not active)","Type":"NUMBER(3,0)"),("Column Name":"COST_CENTER","Description":"Cost Center","Type":"NUMBER(3,0)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEFAULT_DEAL","Description":"Default Deal","Type":"NUMBER(1,0)"),("Column Name":"ELIGIBLE_CAPACITY","Description":"Eligible Capacity","Type":"NUMBER(3,0)"),("Column Name":"DEFICIT_THRESHOLD","Description":"Deficit Thresholdd Floa","Type":"FLOAT"),("Column Name":"BEGIN_DATE","Description":"Begin Dated Date","Type":"DATE"),("Column Name":"NOTES","Description":"Notes","Type":"VARCHAR2(250 BYTE)"),("Column Name":"BUNDLED_FLAG","Description":"Bundled Flag","Type":"NUMBER(1,0)"),("Column Name":"CSA_CONNECT_MAKER_CHECKER","Description":"CSA Connect Maker","Type":"NUMBER(1,0)"),("Column Name":"INVOICE_APPROVER_ELIGIBLE","Description":"Invoice Approver","Type":"NUMBER(1,0)"),("Column Name":"DEAL_ASSOCIATE","Description":"Deal Associate","Type":"VARCHAR2(10 BYTE)"),("Column Name":"DEAL_MANAGER","Description":"Deal Manager","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_MODIFIED_USER","Description":"Last Modified User","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated Time","Type":"TIMESTAMP(6)")]
+table: TRADE = [("Column Name":"TRADE_ID","Description":"Unique Id of the trade table","Type":"NUMBER GENERATED BY DEFAULT AS IDENTITY"),("Column Name":"DEAL_ID","Description":"Deal Id refers to the table DEAL and column DEAL_ID","Type":"NUMBER NOT NULL"),("Column Name":"RATE_ID","Description":"Rate Id refers to the table RATES and column RATE_ID","Type":"NUMBER NOT NULL"),("Column Name":"TRADEDATE","Description":"Trade Date","Type":"DATE"),("Column Name":"PRODUCT_TYPE","Description":"Product Type","Type":"VARCHAR(10)"),("Column Name":"SUB_PRODUCT_TYPE","Description":"Product Sub type","Type":"VARCHAR(10)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR(10)"),("Column Name":"COUNTRY","Description":"Country  Code","Type":"VARCHAR(10)"),("Column Name":"GROSS_BPS","Description":"Gross amount in bps","Type":"NUMBER"),("Column Name":"GROSS_CPS","Description":"Gross amount in cps","Type":"NUMBER"),("Column Name":"TRADE_AREA","Description":"Trading area","Type":"VARCHAR(10)"),("Column Name":"REGION","Description":"Region (NAM,APAC,EMEA)","Type":"VARCHAR(10)"),("Column Name":"GP_NUM","Description":"Grandparent number","Type":"NUMBER"),("Column Name":"PRICE","Description":"Price","Type":"NUMBER"),("Column Name":"SIDE","Description":"Side (b=buy,s=sell)","Type":"VARCHAR(1)"),("Column Name":"QUANTITY","Description":"Trading quantity","Type":"NUMBER"),("Column Name":"PRIN_AMOUNT","Description":"","Type":"NUMBER"),("Column Name":"GROSS_COMMISSION","Description":"Gross Commission","Type":"NUMBER"),("Column Name":"EXECUTION_COMMISSION","Description":"Execution commission","Type":"NUMBER"),("Column Name":"RESEARCH_COMMISSION","Description":"Research Commission","Type":"NUMBER"),("Column Name":"CSA_STATUS","Description":"CSA status (1 =active, 0=inactive)","Type":"NUMBER"),("Column Name":"EXCEPTION_CODE","Description":"Exception code","Type":"NUMBER"),("Column Name":"HARD_CODED_RATE_FLAG","Description":"Hard Coded Rate flag (1=hard coded)","Type":"NUMBER"),("Column Name":"HARD_CODED_RATE","Description":"Hard coded rate indicate the overriden date by the user","Type":"NUMBER"),("Column Name":"HARD_CODE_RATE_TYPE","Description":"Hard coded rate type (cps or bps)","Type":"VARCHAR(10)"),("Column Name":"LAST_UPDATE_USER","Description":"User who modified this record","Type":"VARCHAR2(50)"),("Column Name":"LAST_UPDATE_TIME","Description":"Time when the user modified the record","Type":"TIMESTAMP(6)")]
+Relationship : RATES.DEAL_ID = DEAL.DEAL_ID
+Relationship : DEAL.CLIENT_ID = CLIENT.CLIENT_ID
+Relationship : TRADE.DEAL_ID = DEAL.DEAL_ID
+Relationship : TRADE.RATE_ID = RATES.RATE_ID
+"""
 
 class OracleSearch:
 
-    def __init__(self):
+    def __init__(self, llm=None):
         load_dotenv()
-        user = os.environ.get('ORA_USER')
-        cs = os.environ.get('ORA_CS')
-        pw = os.environ.get('ORA_PWD')
-
-        print(f"User: {user}, Connection String: {cs}")
-
-        engine = create_engine(
-        f'oracle+oracledb://:@',
-        connect_args={
-            "user": user,
-            "password": pw,
-            "dsn": cs
-        })
-
-        db = SQLDatabase(engine)
-        print(db.dialect)
-        print(db.get_usable_table_names())
-        db.run("SELECT count(*) FROM rates")
-
-        llm = ChatOpenAI(
+        # Engine, session pool and schema are shared across instances and Streamlit reruns
+        db = get_database()
+
+        llm = llm or ChatOpenAI(
         model="gpt-3.5-turbo",
         temperature=0,
         #    max_tokens=None,
         #    timeout=None,
         #    max_retries=2,
         )
+        # Client names in questions match no schema word, so CLIENT is always offered
+        self.schema = SchemaRegistry(TABLE_RELATIONSHIPS, always=["CLIENT"])
         toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-        tools = toolkit.get_tools()
+        # sql_db_query is replaced by a tool that validates queries locally, limits rows on the
+        # server and summarizes them; the LLM-backed sql_db_query_checker is not needed
+        tools = [
+            make_query_tool(validator=SqlValidator(self.schema)) if tool.name == "sql_db_query" else tool
+            for tool in toolkit.get_tools() if tool.name != "sql_db_query_checker"
+        ]
 
         SQL_PREFIX = """You are an agent designed to interact with an Oracle SQL database.
         Given an input question, user the Table_Relationships provide below to create a syntactically correct Oracle SQL query to run, then look at the results of the query and return the answer.
         Unless the user specifies a specific number of rows, always limit your query to at most 5 results.
         You have access to tools for interacting with the database.
-        You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+        Your query is checked against Table_Relationships when you run it. If you get an error while executing a query, rewrite the query and try again.
         You will use only tables provided in Table_Relationships for quering the result
         If the question contains trade then include trade table in the join
         
-        Table_Relationships
-        table: RATES = [("Column Name":"RATE_ID","Description":"Rate Id","Type":"NUMBER"),("Column Name":"DEAL_ID","Description":"Deal Id refers to table DEAL and column DEAL_ID","Type":"NUMBER(22,0)"),("Column Name":"PRIORITY","Description":"Priority (1 is highest)","Type":"NUMBER(22,0)"),("Column Name":"PRODUCT_TYPE","Description":"Product Type","Type":"VARCHAR2(10 BYTE)"),("Column Name":"SUB_PRODUCT_TYPE","Description":"Product Sub type","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"COUNTRY","Description":"Country  Code","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CMSN_TYPE","Description":"Commission Type (cps=cents per share, bps=basis points)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CMSN_MIN","Description":"Minimum Commission","Type":"NUMBER(22,0)"),("Column Name":"CMSN_MAX","Description":"Maximum Commission","Type":"NUMBER(22,0)"),("Column Name":"TRADE_AREA","Description":"Trade Area","Type":"VARCHAR2(20 BYTE)"),("Column Name":"REGION","Description":"Region (NAM=North America,EMEA=EUROPE,APAC=Asiapac,UK=United Kingdom)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"GP_NUM","Description":"Grandparent number","Type":"VARCHAR2(10 BYTE)"),("Column Name":"PRICE_MIN","Description":"Minimum Price","Type":"NUMBER(22,0)",("Column Name":"PRICE_MAX","Description":"Maximum Price","Type":"NUMBER(22,0)"),("Column Name":"SIDE","Description":"Side (S=Sell, B=Buy)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"QUANTITY_MIN","Description":"Minimum Quantity","Type":"NUMBER(22,0)"),("Column Name":"QUANTTITY_MAX","Description":"Maximum Quantity","Type":"NUMBER(22,0)"),("Column Name":"RSCH_TYPE","Description":"Research Fee Type (cps=cents per share, bps=basis points, rate=1 indicates 100%)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"RSCH_FEE","Description":"Research Fee","Type":"NUMBER(22,0)"),("Column Name":"EXEC_TYPE","Description":"Execution Fee Type (cps=cents per share, bps=basis points)","Type":"VARCHAR2(10 BYTE)"),("Column Name":"EXEC_FEE","Description":"Execution Fee","Type":"NUMBER(22,0)"),("Column Name":"BEGIN_DATE","Description":"Effective from","Type":"DATE"),("Column Name":"END_DATE","Description":"Effective till","Type":"DATE"),("Column Name":"STATUS","Description":"Status (1 is active, > 1 is not active)","Type":"NUMBER(22,0)"),("Column Name":"COMMENTS","Description":"User comments","Type":"VARCHAR2(255 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated time","Type":"TIMESTAMP(6)"),("Column Name":"LAST_UPDATE_USER","Description":"Last Updated user","Type":"VARCHAR2(255 BYTE)")]
-        table: CLIENT = [("Column Name":"CLIENT_ID","Description":"Client ID ","Type":"NUMBER"),("Column Name":"GP_NUM","Description":"Grandparent Number","Type":"VARCHAR2(10 BYTE)"),("Column Name":"CLIENT_NAME","Description":"Client Name","Type":"VARCHAR2(10 BYTE)"),("Column Name":"PAYMENT_FREQUENCY","Description":"Payment Frequency (1=Monthly,2=Yearly)","Type":"NUMBER"),("Column Name":"LAST_MODIFIED_USER","Description":"Last Updated time","Type":"VARCHAR2(20 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated user","Type":"TIMESTAMP(6)")]
-        table: DEAL = [("Column Name":"DEAL_ID","Description":"Deal Id","Type":"NUMBER"),("Column Name":"DEAL_MNC","Description":"Deal Mnemonic","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEAL_TYPE","Description":"Deal Type(1=Regular,4=Classic,2=Partial,3=Full)","Type":"NUMBER(3,0)"),("Column Name":"CLIENT_ID","Description":"Client Id refers to the table CLIENT and column CLIENT_ID","Type":"NUMBER(10,0)"),("Column Name":"STATUS","Description":"Status (1 is active, > 1 is not active)","Type":"NUMBER(3,0)"),("Column Name":"COST_CENTER","Description":"Cost Center","Type":"NUMBER(3,0)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEFAULT_DEAL","Description":"Default Deal","Type":"NUMBER(1,0)"),("Column Name":"ELIGIBLE_CAPACITY","Description":"Eligible Capacity","Type":"NUMBER(3,0)"),("Column Name":"DEFICIT_THRESHOLD","Description":"Deficit Thresholdd Floa","Type":"FLOAT"),("Column Name":"BEGIN_DATE","Description":"Begin Dated Date","Type":"DATE"),("Column Name":"NOTES","Description":"Notes","Type":"VARCHAR2(250 BYTE)"),("Column Name":"BUNDLED_FLAG","Description":"Bundled Flag","Type":"NUMBER(1,0)"),("Column Name":"CSA_CONNECT_MAKER_CHECKER","Description":"CSA Connect Maker","Type":"NUMBER(1,0)"),("Column Name":"INVOICE_APPROVER_ELIGIBLE","Description":"Invoice Approver","Type":"NUMBER(1,0)"),("Column Name":"DEAL_ASSOCIATE","Description":"Deal Associate","Type":"VARCHAR2(10 BYTE)"),("Column Name":"DEAL_MANAGER","Description":"Deal Manager","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_MODIFIED_USER","Description":"Last Modified User","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated Time","Type":"TIMESTAMP(6)")]
-        table: TRADE = [("Column Name":"TRADE_ID","Description":"Unique Id of the trade table","Type":"NUMBER GENERATED BY DEFAULT AS IDENTITY"),("Column Name":"DEAL_ID","Description":"Deal Id refers to the table DEAL and column DEAL_ID","Type":"NUMBER NOT NULL"),("Column Name":"RATE_ID","Description":"Rate Id refers to the table RATES and column RATE_ID","Type":"NUMBER NOT NULL"),("Column Name":"TRADEDATE","Description":"Trade Date","Type":"DATE"),("Column Name":"PRODUCT_TYPE","Description":"Product Type","Type":"VARCHAR(10)"),("Column Name":"SUB_PRODUCT_TYPE","Description":"Product Sub type","Type":"VARCHAR(10)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR(10)"),("Column Name":"COUNTRY","Description":"Country  Code","Type":"VARCHAR(10)"),("Column Name":"GROSS_BPS","Description":"Gross amount in bps","Type":"NUMBER"),("Column Name":"GROSS_CPS","Description":"Gross amount in cps","Type":"NUMBER"),("Column Name":"TRADE_AREA","Description":"Trading area","Type":"VARCHAR(10)"),("Column Name":"REGION","Description":"Region (NAM,APAC,EMEA)","Type":"VARCHAR(10)"),("Column Name":"GP_NUM","Description":"Grandparent number","Type":"NUMBER"),("Column Name":"PRICE","Description":"Price","Type":"NUMBER"),("Column Name":"SIDE","Description":"Side (b=buy,s=sell)","Type":"VARCHAR(1)"),("Column Name":"QUANTITY","Description":"Trading quantity","Type":"NUMBER"),("Column Name":"PRIN_AMOUNT","Description":"","Type":"NUMBER"),("Column Name":"GROSS_COMMISSION","Description":"Gross Commission","Type":"NUMBER"),("Column Name":"EXECUTION_COMMISSION","Description":"Execution commission","Type":"NUMBER"),("Column Name":"RESEARCH_COMMISSION","Description":"Research Commission","Type":"NUMBER"),("Column Name":"CSA_STATUS","Description":"CSA status (1 =active, 0=inactive)","Type":"NUMBER"),("Column Name":"EXCEPTION_CODE","Description":"Exception code","Type":"NUMBER"),("Column Name":"HARD_CODED_RATE_FLAG","Description":"Hard Coded Rate flag (1=hard coded)","Type":"NUMBER"),("Column Name":"HARD_CODED_RATE","Description":"Hard coded rate indicate the overriden date by the user","Type":"NUMBER"),("Column Name":"HARD_CODE_RATE_TYPE","Description":"Hard coded rate type (cps or bps)","Type":"VARCHAR(10)"),("Column Name":"LAST_UPDATE_USER","Description":"User who modified this record","Type":"VARCHAR2(50)"),("Column Name":"LAST_UPDATE_TIME","Description":"Time when the user modified the record","Type":"TIMESTAMP(6)")]
-        Relationship : RATES.DEAL_ID = DEAL.DEAL_ID
-        Relationship : DEAL.CLIENT_ID = CLIENT.CLIENT_ID
-        Relationship : TRADE.DEAL_ID = DEAL.DEAL_ID
-        Relationship : TRADE.RATE_ID = RATES.RATE_ID
+        {schema}
 
         When possible try to join tables to extend the retrieved information.
         Suppress results if the value is -1
@@ -112,11 +112,123 @@ class OracleSearch:
         #table: DEAL = [("Column Name":"DEAL_ID","Description":"Deal Id","Type":"NUMBER"),("Column Name":"DEAL_MNC","Description":"Deal Mnemonic","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEAL_TYPE","Description":"Deal Type(1=Regular,4=Classic,2=Partial,3=Full)","Type":"NUMBER(3,0)"),("Column Name":"CLIENT_ID","Description":"Client Id refers to the table CLIENT and column CLIENT_ID","Type":"NUMBER(10,0)"),("Column Name":"STATUS","Description":"Status (1 is active, > 1 is not active)","Type":"NUMBER(3,0)"),("Column Name":"COST_CENTER","Description":"Cost Center","Type":"NUMBER(3,0)"),("Column Name":"CURRENCY","Description":"Currency (ISO 3 character code)","Type":"VARCHAR2(20 BYTE)"),("Column Name":"DEFAULT_DEAL","Description":"Default Deal","Type":"NUMBER(1,0)"),("Column Name":"ELIGIBLE_CAPACITY","Description":"Eligible Capacity","Type":"NUMBER(3,0)"),("Column Name":"DEFICIT_THRESHOLD","Description":"Deficit Thresholdd Floa","Type":"FLOAT"),("Column Name":"BEGIN_DATE","Description":"Begin Dated Date","Type":"DATE"),("Column Name":"NOTES","Description":"Notes","Type":"VARCHAR2(250 BYTE)"),("Column Name":"BUNDLED_FLAG","Description":"Bundled Flag","Type":"NUMBER(1,0)"),("Column Name":"CSA_CONNECT_MAKER_CHECKER","Description":"CSA Connect Maker","Type":"NUMBER(1,0)"),("Column Name":"INVOICE_APPROVER_ELIGIBLE","Description":"Invoice Approver","Type":"NUMBER(1,0)"),("Column Name":"DEAL_ASSOCIATE","Description":"Deal Associate","Type":"VARCHAR2(10 BYTE)"),("Column Name":"DEAL_MANAGER","Description":"Deal Manager","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_MODIFIED_USER","Description":"Last Modified User","Type":"VARCHAR2(10 BYTE)"),("Column Name":"LAST_UPDATE_TIME","Description":"Last Updated Time","Type":"TIMESTAMP(6)")]
 
 
-        system_message = SystemMessage(content=SQL_PREFIX)
-        self.agent_executor = create_react_agent(llm, tools, state_modifier=system_message)
+        # Only the tables and columns relevant to the question go into the system prompt
+        self.sql_prefix = SQL_PREFIX
+        self.agent_executor = create_react_agent(llm, tools, state_modifier=self._prompt)
+        self.cache = AnswerCache('qna')
+        self._local = threading.local()
+        start_metrics_server()
+        self.templates = TemplateStore('qna', format_table)
+
+    def _prompt(self, state):
+        question = next((m.content for m in state["messages"] if isinstance(m, HumanMessage)), "")
+        schema = self.schema.render(question)
+        return [SystemMessage(content=self.sql_prefix.replace("{schema}", schema))] + state["messages"]
 
     def executeQuery(self, msg):
-        response=self.agent_executor.invoke({"messages": [HumanMessage(content=msg)]})
+        with trace_request('qna', msg) as trace:
+            self._local.sql = None
+            result = self._cachedAnswer(msg)
+            if result is None:
+                # The data version the answer is built from; put() skips it if that moves on
+                version = self.cache.version()
+                result = self._runQuery(msg, trace)
+                self.cache.put(msg, result, version)
+        return result
+
+    def _cachedAnswer(self, msg):
+        with span("cache.get"):
+            result = self.cache.get(msg)
+        if result is not None:
+            annotate("cache")
+        return result
+
+    def _answerLocally(self, msg):
+        # Questions shaped like one the agent already solved reuse its query with new binds
+        result = self.templates.answer(msg)
+        if result is not None:
+            annotate("template")
+        return result
+
+    def _runQuery(self, msg, trace):
+        result = self._answerLocally(msg)
+        if result is None:
+            annotate("agent")
+            response=self.agent_executor.invoke({"messages": [HumanMessage(content=msg)]}, config={"callbacks": [trace.callback()]})
+            result = self._handleResponse(msg, response)
+        return result
+
+    async def executeQueryAsync(self, msg):
+        # Blocking cache/database work runs in threads so many requests can share one event loop
+        with trace_request('qna', msg) as trace:
+            result = await asyncio.to_thread(self._cachedAnswer, msg)
+            if result is None:
+                version = await asyncio.to_thread(self.cache.version)
+                result = await asyncio.to_thread(self._answerLocally, msg)
+                if result is None:
+                    annotate("agent")
+                    response = await self.agent_executor.ainvoke({"messages": [HumanMessage(content=msg)]}, config={"callbacks": [trace.callback()]})
+                    # Learning a template writes the store file
+                    result = await asyncio.to_thread(self._handleResponse, msg, response)
+                await asyncio.to_thread(self.cache.put, msg, result, version)
+        return result
+
+    def streamQuery(self, msg, cancel=None, timeout=None):
+        """Yields ("sql", query), ("tool", name, content) and ("token", text) events while
+        the agent runs, then ("answer", result) or ("cancelled", reason)."""
+        with trace_request('qna', msg) as trace:
+            self._local.sql = None
+            result = self._cachedAnswer(msg)
+            version = None
+            if result is None:
+                version = self.cache.version()
+                result = self._answerLocally(msg)
+                if result is not None:
+                    self.cache.put(msg, result, version)
+            if result is not None:
+                yield ("answer", result)
+                return
+
+            annotate("agent")
+            timeout = timeout or float(os.environ.get('ORA_AGENT_TIMEOUT', 120))
+            deadline = time.monotonic() + timeout
+            messages = [HumanMessage(content=msg)]
+            stream = self.agent_executor.stream({"messages": messages}, stream_mode=["updates", "messages"],
+                                                config={"callbacks": [trace.callback()]})
+            try:
+                for mode, chunk in stream:
+                    if cancel is not None and cancel.is_set():
+                        trace.status = "cancelled"
+                        yield ("cancelled", "Cancelled")
+                        return
+                    if time.monotonic() > deadline:
+                        trace.status = "cancelled"
+                        yield ("cancelled", f"Timed out after {timeout:.0f}s")
+                        return
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if metadata.get("langgraph_node") == "agent" and isinstance(message.content, str) and message.content:
+                            yield ("token", message.content)
+                        continue
+                    for update in chunk.values():
+                        for message in (update or {}).get("messages", []):
+                            messages.append(message)
+                            for call in getattr(message, "tool_calls", None) or []:
+                                if call["name"] == "sql_db_query":
+                                    yield ("sql", call["args"].get("query", ""))
+                            if isinstance(message, ToolMessage):
+                                yield ("tool", message.name, str(message.content))
+            finally:
+                # Closing the stream stops the graph before its next step
+                stream.close()
+
+            result = self._handleResponse(msg, {"messages": messages})
+            self.cache.put(msg, result, version)
+            yield ("answer", result)
+
+    def _handleResponse(self, msg, response):
+        self._local.sql = extract_final_query(response["messages"])
+        self.templates.learn(msg, response["messages"])
         message = response["messages"][-1]
         #message = response["messages"]
         result=""
@@ -149,18 +261,56 @@ class OracleSearch:
         # Button: User triggers the search
         if st.button("Search"):
             if search_query:
-                # Perform the search and get results
-                result = self.executeQuery(search_query)
+                # Any widget interaction (e.g. Cancel) reruns the script, which stops the agent run
+                st.button("Cancel")
+                st.write("AI Output: ")
+                steps = st.status("Working...", expanded=True)
+                answer = st.empty()
+                tokens = ""
+                result = None
+                # Stream the generated SQL, tool results and answer tokens as they arrive
+                for event in self.streamQuery(search_query):
+                    if event[0] == "sql":
+                        tokens = ""
+                        steps.code(event[1], language="sql")
+                    elif event[0] == "tool":
+                        steps.text(f"{event[1]}: {event[2][:500]}")
+                    elif event[0] == "token":
+                        tokens += event[1]
+                        answer.markdown(tokens)
+                    elif event[0] == "answer":
+                        result = event[1]
+                    elif event[0] == "cancelled":
+                        steps.update(label=event[1], state="error")
+                st.session_state["last_sql"] = self._local.sql
                 # Display search results
-                try:
-                    st.write("AI Output: ")
-                    st.write(f"{result}")
-                    #st.json(results)
-                except Exception as e:
-                    print(f"Error: {e}")
+                if result is not None:
+                    steps.update(label="Done", state="complete", expanded=False)
+                    try:
+                        answer.write(f"{result}")
+                        #st.json(results)
+                    except Exception as e:
+                        print(f"Error: {e}")
                 st.divider()
 
+        # The full result is streamed from the database in chunks instead of going through the agent
+        last_sql = st.session_state.get("last_sql")
+        if last_sql and st.button("Show full result"):
+            st.code(last_sql, language="sql")
+            self.showFullResult(last_sql)
+
+    def showFullResult(self, sql):
+        limit = int(os.environ.get('ORA_DISPLAY_MAX_ROWS', 10000))
+        shown = 0
+        for columns, rows in stream_query(sql):
+            st.dataframe([dict(zip(columns, row)) for row in rows])
+            shown += len(rows)
+            if shown >= limit:
+                st.write(f"Showing the first {shown} rows.")
+                break
+
 
 if __name__ == "__main__":
-    oraSrch = OracleSearch()
+    # One OracleSearch per process instead of one per Streamlit rerun
+    oraSrch = shared_instance('ora_search_qna', OracleSearch)
     oraSrch.start()
\ No newline at end of file
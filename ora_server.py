@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import importlib
+import multiprocessing
+from aiohttp import web
+from ora_shared import shared_instance, pool_health
+from ora_cache import normalize_question
+from ora_trace import metrics
+
+# HTTP API around OracleSearch for upstream systems.
+#
+#   python ora_server.py --port 8080 --workers 8 --queue 64 --timeout 60 --processes 4
+#
+#   POST /v1/rates   structured rate payload, e.g. {"client": "acme", "currency": "usd"}
+#   POST /v1/query   {"question": "...", "variant": "qna" | "system"}
+#   GET  /health     database ping, pool usage and queue depth
+#   GET  /metrics    Prometheus metrics (see ora_trace)
+#
+# Requests go through a bounded queue to a fixed number of async workers. When the queue
+# is full the server answers 503 with Retry-After instead of piling up work, and a
+# request that is not answered within the timeout gets 504. Each queued run has a
+# deadline of the timeout from when it was queued: workers skip runs that are past it
+# or that every caller has given up on, and a run stops once nobody waits for it.
+# Identical requests that arrive while one is in flight (same variant and normalized
+# question, as used by the answer cache) wait for that run instead of starting another
+# one. --processes starts several server processes sharing the port (SO_REUSEPORT),
+# each with its own OracleSearch, session pool and workers.
+
+VARIANTS = {"qna": "ora_search_qna", "system": "ora_search_system"}
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class Job:
+    """One queued run and the callers waiting for it."""
+
+    def __init__(self, variant, question, deadline):
+        self.variant = variant
+        self.question = question
+        self.deadline = deadline
+        self.waiters = 1
+        self.future = asyncio.get_running_loop().create_future()
+        # Nobody may be left to read a failure; retrieve it so asyncio does not log it
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+class QueryServer:
+
+    def __init__(self, variants, workers=8, queue_size=64, timeout=60.0):
+        self.variants = variants
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.searchers = {}
+        self.inflight = {}
+        self.queue = None
+        self._tasks = []
+
+    async def start(self, app):
+        for variant in self.variants:
+            module = importlib.import_module(VARIANTS[variant])
+            # OracleSearch() connects and builds the agent; keep it off the event loop
+            self.searchers[variant] = await asyncio.to_thread(shared_instance, VARIANTS[variant], module.OracleSearch)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        print(f"Serving {', '.join(self.variants)} with {self.workers} workers, queue {self.queue_size}, timeout {self.timeout}s")
+
+    async def stop(self, app):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                remaining = job.deadline - loop.time()
+                if job.future.done() or remaining <= 0:
+                    # Every caller already gave up (or got a 504); do not run it for nobody
+                    metrics.inc("ora_server_dropped_total", {"variant": job.variant})
+                    if not job.future.done():
+                        job.future.cancel()
+                    continue
+                run = asyncio.ensure_future(
+                    asyncio.wait_for(self.searchers[job.variant].executeQueryAsync(job.question), remaining))
+                # The last waiter leaving cancels the future, which stops the run
+                job.future.add_done_callback(lambda f, run=run: f.cancelled() and run.cancel())
+                try:
+                    result = await run
+                except asyncio.CancelledError:
+                    if not job.future.cancelled():
+                        raise
+                    metrics.inc("ora_server_dropped_total", {"variant": job.variant})
+                    continue
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, variant, question):
+        """Returns (job, coalesced). Raises asyncio.QueueFull when the queue is full."""
+        key = (variant, normalize_question(question))
+        job = self.inflight.get(key)
+        if job is not None:
+            job.waiters += 1
+            metrics.inc("ora_server_coalesced_total", {"variant": variant})
+            return job, True
+        job = Job(variant, question, asyncio.get_running_loop().time() + self.timeout)
+        self.queue.put_nowait(job)
+        self.inflight[key] = job
+        job.future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return job, False
+
+    async def answer(self, variant, question):
+        try:
+            job, coalesced = self.submit(variant, question)
+        except asyncio.QueueFull:
+            metrics.inc("ora_server_rejected_total", {"variant": variant})
+            return web.json_response({"error": "server busy, retry later"}, status=503, headers={"Retry-After": "1"})
+        headers = {"X-Ora-Coalesced": "1" if coalesced else "0"}
+        try:
+            # shield: one caller giving up must not cancel the run the others wait for
+            result = await asyncio.wait_for(asyncio.shield(job.future), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("ora_server_timeouts_total", {"variant": variant})
+            return web.json_response({"error": f"no answer within {self.timeout:g}s"}, status=504, headers=headers)
+        except asyncio.CancelledError:
+            if not job.future.cancelled():
+                raise
+            return web.json_response({"error": "request was abandoned"}, status=504, headers=headers)
+        except Exception as e:
+            return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=500, headers=headers)
+        finally:
+            job.waiters -= 1
+            if job.waiters == 0 and not job.future.done():
+                # Last caller gone (timeout or disconnect): mark the run abandoned
+                job.future.cancel()
+        # The system variant answers with a JSON document, the QnA variant with text
+        try:
+            body = json.loads(result)
+        except (TypeError, ValueError):
+            body = {"answer": result}
+        return web.json_response(body, headers=headers)
+
+    async def handle_rates(self, request):
+        if "system" not in self.searchers:
+            return web.json_response({"error": "the system variant is not served"}, status=404)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": "body must be a JSON object"}, status=400)
+        if not isinstance(payload, dict):
+            return web.json_response({"error": "body must be a JSON object"}, status=400)
+        return await self.answer("system", json.dumps(payload))
+
+    async def handle_query(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "body must be a JSON object"}, status=400)
+        if not isinstance(body, dict) or not str(body.get("question") or "").strip():
+            return web.json_response({"error": "question is required"}, status=400)
+        variant = body.get("variant", "qna")
+        if variant not in self.searchers:
+            return web.json_response({"error": f"variant {variant!r} is not served"}, status=404)
+        return await self.answer(variant, str(body["question"]))
+
+    async def handle_health(self, request):
+        health = {
+            "variants": sorted(self.searchers),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "inflight": len(self.inflight),
+        }
+        try:
+            health["pool"] = await asyncio.to_thread(pool_health)
+        except Exception as e:
+            health["error"] = f"{type(e).__name__}: {e}"
+            return web.json_response(health, status=503)
+        return web.json_response(health)
+
+    async def handle_metrics(self, request):
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    def app(self):
+        app = web.Application()
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        app.add_routes([
+            web.post("/v1/rates", self.handle_rates),
+            web.post("/v1/query", self.handle_query),
+            web.get("/health", self.handle_health),
+            web.get("/metrics", self.handle_metrics),
+        ])
+        return app
+
+
+def serve(args):
+    server = QueryServer(args.variants.split(","), args.workers, args.queue, args.timeout)
+    web.run_app(server.app(), host=args.host, port=args.port, reuse_port=args.processes > 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve OracleSearch over HTTP")
+    parser.add_argument("--host", default=os.environ.get('ORA_SERVER_HOST', "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int('ORA_SERVER_PORT', 8080))
+    parser.add_argument("--variants", default=os.environ.get('ORA_SERVER_VARIANTS', "qna,system"))
+    parser.add_argument("--workers", type=int, default=_env_int('ORA_SERVER_WORKERS', 8), help="concurrent requests per process")
+    parser.add_argument("--queue", type=int, default=_env_int('ORA_SERVER_QUEUE', 64), help="queued requests before 503")
+    parser.add_argument("--timeout", type=float, default=float(os.environ.get('ORA_SERVER_TIMEOUT', 60)), help="seconds per request")
+    parser.add_argument("--processes", type=int, default=_env_int('ORA_SERVER_PROCESSES', 1))
+    args = parser.parse_args(argv)
+    unknown = set(args.variants.split(",")) - set(VARIANTS)
+    if unknown:
+        parser.error(f"unknown variants: {', '.join(sorted(unknown))}")
+
+    if args.processes <= 1:
+        serve(args)
+        return 0
+    processes = [multiprocessing.Process(target=serve, args=(args,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    print(f"Listening on http://{args.host}:{args.port} with {args.processes} processes")
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import os
+import json
+import tempfile
+import threading
+import oracledb
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from langchain_community.utilities import SQLDatabase
+
+# Process-wide resources shared by every OracleSearch instance.
+# Streamlit re-executes the entry script on every widget interaction, but imported
+# modules stay cached in sys.modules, so state kept here survives reruns.
+
+_lock = threading.RLock()
+_pool = None
+_engine = None
+_database = None
+_instances = {}
+_connection_factory = None
+_dialect = None
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def get_pool():
+    """Returns the process-wide oracledb session pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                load_dotenv()
+                user = os.environ.get('ORA_USER')
+                cs = os.environ.get('ORA_CS')
+                pw = os.environ.get('ORA_PWD')
+                print(f"User: {user}, Connection String: {cs}")
+                _pool = oracledb.create_pool(
+                    user=user,
+                    password=pw,
+                    dsn=cs,
+                    min=_env_int('ORA_POOL_MIN', 1),
+                    max=_env_int('ORA_POOL_MAX', 8),
+                    increment=_env_int('ORA_POOL_INCREMENT', 1),
+                    # Sessions idle for longer than this are pinged before being handed out
+                    ping_interval=_env_int('ORA_POOL_PING_INTERVAL', 60),
+                    timeout=_env_int('ORA_POOL_IDLE_TIMEOUT', 300),
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=_env_int('ORA_POOL_WAIT_TIMEOUT', 10000),
+                )
+    return _pool
+
+
+def get_engine():
+    """Returns a SQLAlchemy engine that borrows its connections from the oracledb pool."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                pool = get_pool()
+                # Pooling is done by oracledb, so SQLAlchemy must not keep its own pool on top
+                _engine = create_engine(
+                    'oracle+oracledb://',
+                    creator=pool.acquire,
+                    poolclass=NullPool,
+                )
+    return _engine
+
+
+def configure(engine, connection_factory, dialect):
+    """Points the shared resources at another database, e.g. the SQLite fixture of
+    ora_bench. connection_factory must return a context manager yielding a DB-API
+    connection."""
+    global _engine, _database, _connection_factory, _dialect
+    with _lock:
+        _engine = engine
+        _database = None
+        _connection_factory = connection_factory
+        _dialect = dialect
+
+
+def get_dialect():
+    return _dialect or "oracle"
+
+
+def limit_clause(max_rows):
+    """Row limiting clause for the configured dialect."""
+    if get_dialect() == "sqlite":
+        return f"LIMIT {max_rows}"
+    return f"FETCH FIRST {max_rows} ROWS ONLY"
+
+
+def get_connection():
+    """Borrows a session from the pool; use as a context manager to give it back."""
+    if _connection_factory is not None:
+        return _connection_factory()
+    return get_pool().acquire()
+
+
+def pool_health():
+    """Round-trips to the database on a pooled session and reports the pool usage."""
+    if _connection_factory is not None:
+        with get_connection() as connection:
+            connection.cursor().execute("SELECT 1" if get_dialect() == "sqlite" else "SELECT 1 FROM DUAL")
+        return {"dialect": get_dialect()}
+    pool = get_pool()
+    with pool.acquire() as connection:
+        connection.ping()
+    return {"opened": pool.opened, "busy": pool.busy, "min": pool.min, "max": pool.max}
+
+
+def _snapshot_path():
+    return os.environ.get('ORA_SCHEMA_SNAPSHOT', '.ora_schema_snapshot.json')
+
+
+def load_schema_snapshot():
+    """Returns the stored snapshot, or None when there is none or it cannot be used."""
+    path = _snapshot_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot.get("tables"), list) and isinstance(snapshot.get("table_info"), dict):
+            return snapshot
+        print(f"Error: ignoring incomplete schema snapshot {path}")
+    except (OSError, ValueError, AttributeError) as e:
+        # Reflect the schema again (and rewrite the file) rather than fail to start
+        print(f"Error: ignoring unreadable schema snapshot {path}: {e}")
+    return None
+
+
+def save_schema_snapshot(db):
+    """Persists the usable table names and their table info for the next cold start."""
+    tables = list(db.get_usable_table_names())
+    snapshot = {
+        "dialect": db.dialect,
+        "tables": tables,
+        "table_info": {table: db.get_table_info([table]) for table in tables},
+    }
+    # Write a temporary file and swap it in, so a crash or a concurrent start never
+    # leaves a partially written snapshot behind
+    path = _snapshot_path()
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".ora_schema_snapshot.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return snapshot
+
+
+def get_database():
+    """Returns the shared SQLDatabase.
+
+    When a schema snapshot exists the tables are not reflected at startup; the
+    stored table info is handed to SQLDatabase instead. Delete the snapshot file
+    (ORA_SCHEMA_SNAPSHOT) after a schema change to have it rebuilt.
+    """
+    global _database
+    if _database is None:
+        with _lock:
+            if _database is None:
+                engine = get_engine()
+                snapshot = load_schema_snapshot()
+                if snapshot:
+                    db = SQLDatabase(
+                        engine,
+                        include_tables=snapshot["tables"],
+                        custom_table_info=snapshot["table_info"],
+                        lazy_table_reflection=True,
+                    )
+                else:
+                    db = SQLDatabase(engine)
+                    try:
+                        snapshot = save_schema_snapshot(db)
+                    except OSError as e:
+                        # The snapshot only speeds up the next start
+                        print(f"Error: could not write the schema snapshot: {e}")
+                        snapshot = {"tables": list(db.get_usable_table_names())}
+                print(db.dialect)
+                print(snapshot["tables"])
+                _database = db
+    return _database
+
+
+def shared_instance(key, factory):
+    """Lazily builds one instance per key for the life of the process (thread-safe)."""
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                instance = factory()
+                _instances[key] = instance
+    return instance
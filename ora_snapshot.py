@@ -0,0 +1,308 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from ora_shared import get_connection, get_dialect
+from ora_cache import WATERMARK_QUERIES
+from ora_trace import span
+
+# In-memory columnar snapshot of the TRADE/DEAL/CLIENT join behind structured rate
+# lookups (ORA_RATE_SNAPSHOT=1).
+# Every string column is dictionary-encoded into int32 code arrays; price, quantity and
+# the rate itself are float64 arrays. Client name, currency, country, side and GP number
+# have hash indexes (code -> row positions), so a lookup intersects a few small position
+# arrays instead of querying Oracle. Every ORA_RATE_SNAPSHOT_INTERVAL seconds a
+# background thread re-reads the rows whose LAST_UPDATE_TIME is at or after the previous
+# poll's newest value minus ORA_RATE_SNAPSHOT_OVERLAP seconds, so rows committed late by
+# transactions shorter than the overlap are not missed; re-read rows simply overwrite
+# their old copies. A full reload every ORA_RATE_SNAPSHOT_RELOAD seconds picks up deleted
+# rows and anything committed later than the overlap allows. Answers are therefore up
+# to one interval stale, and deletions up to one reload interval.
+
+SNAPSHOT_QUERY = """SELECT T.TRADE_ID, C.CLIENT_NAME, T.GP_NUM, T.PRODUCT_TYPE, T.CURRENCY, T.COUNTRY, T.TRADE_AREA,
+T.REGION, T.PRICE, T.SIDE, T.QUANTITY, T.HARD_CODED_RATE, T.LAST_UPDATE_USER, T.LAST_UPDATE_TIME
+FROM TRADE T
+JOIN DEAL D ON T.DEAL_ID = D.DEAL_ID
+JOIN CLIENT C ON D.CLIENT_ID = C.CLIENT_ID"""
+
+CHANGED_SINCE = """
+WHERE T.LAST_UPDATE_TIME >= :since OR D.LAST_UPDATE_TIME >= :since OR C.LAST_UPDATE_TIME >= :since"""
+
+# Position of each column in SNAPSHOT_QUERY
+SOURCE = {
+    "client": 1, "gp_num": 2, "product_type": 3, "currency": 4, "country": 5, "trade_area": 6,
+    "region": 7, "price": 8, "side": 9, "quantity": 10, "rate": 11, "user": 12, "last_update_time": 13,
+}
+
+# Request keys (see ora_rate_lookup.RATE_FIELDS) matched on the uppercase value
+TEXT_KEYS = ("client", "product_type", "currency", "country", "trade_area", "region", "side")
+NUMBER_KEYS = ("price", "quantity")
+INDEXED = ("client", "currency", "country", "side", "gp_num")
+# Columns returned, in ora_rate_lookup.RESPONSE_KEYS order, kept as the driver returned them
+OUTPUT = ("rate", "country", "currency", "side", "user", "last_update_time")
+
+# numpy is only needed once the snapshot is enabled; see _numpy()
+np = None
+EMPTY = None
+
+
+def _numpy():
+    global np, EMPTY
+    if np is None:
+        import numpy
+        EMPTY = numpy.empty(0, dtype=numpy.int64)
+        np = numpy
+
+
+def _text_key(value):
+    return None if value is None else str(value).strip().upper()
+
+
+def _number_key(value):
+    # GP_NUM is compared as a number, as Oracle does when the bind is numeric
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _text_key(value)
+
+
+def _minus(watermark, seconds):
+    """watermark moved back by seconds; SQLite returns timestamps as text."""
+    if isinstance(watermark, datetime):
+        return watermark - timedelta(seconds=seconds)
+    try:
+        return (datetime.fromisoformat(str(watermark)) - timedelta(seconds=seconds)).isoformat(sep=" ")
+    except ValueError:
+        return watermark
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Dictionary:
+    """Append-only value <-> int32 code mapping, shared by the snapshot versions between
+    two full reloads."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, values):
+        codes = np.empty(len(values), dtype=np.int32)
+        for index, value in enumerate(values):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            codes[index] = code
+        return codes
+
+    def code(self, value):
+        return self.codes.get(value)
+
+
+class Columns:
+    """One immutable version of the snapshot; refreshes build a new one and swap it in."""
+
+    def __init__(self, ids, keys, raw, numbers, dictionaries):
+        self.dictionaries = dictionaries
+        self.ids = ids
+        self.keys = keys
+        self.raw = raw
+        self.numbers = numbers
+        self.size = len(ids)
+        self.positions = {trade_id: position for position, trade_id in enumerate(ids.tolist())}
+        self.indexes = {name: self._index(keys[name]) for name in INDEXED}
+        # HARD_CODED_RATE <> -1 (NULL rates never match either)
+        rate = numbers["rate"]
+        self.live = ~np.isnan(rate) & (rate != -1)
+        # Sort rank of every LAST_UPDATE_TIME code, for ORDER BY ... DESC NULLS LAST
+        times = dictionaries["raw.last_update_time"].values
+        ranks = np.empty(len(times), dtype=np.int64)
+        ordered = sorted(range(len(times)), key=lambda code: (times[code] is not None, str(times[code])))
+        ranks[ordered] = np.arange(len(times))
+        self.time_rank = ranks[raw["last_update_time"]] if self.size else EMPTY
+
+    @staticmethod
+    def _index(codes):
+        order = np.argsort(codes, kind="stable")
+        ordered = codes[order]
+        bounds = np.flatnonzero(np.diff(ordered)) + 1
+        return {int(chunk_codes[0]): chunk for chunk_codes, chunk in zip(np.split(ordered, bounds), np.split(order, bounds)) if len(chunk)}
+
+    def nbytes(self):
+        arrays = [self.ids, self.live, self.time_rank, *self.keys.values(), *self.raw.values(), *self.numbers.values()]
+        return sum(array.nbytes for array in arrays)
+
+
+class RateSnapshot:
+
+    def __init__(self, interval=None, reload_interval=None):
+        _numpy()
+        self.interval = float(interval or os.environ.get('ORA_RATE_SNAPSHOT_INTERVAL', 30))
+        self.reload_interval = float(reload_interval or os.environ.get('ORA_RATE_SNAPSHOT_RELOAD', 3600))
+        self.overlap = float(os.environ.get('ORA_RATE_SNAPSHOT_OVERLAP', 300))
+        self._columns = None
+        self._watermark = None
+        self._loaded = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Loads the snapshot and starts the background refresh thread."""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error: rate snapshot load failed: {e}")
+        self._thread = threading.Thread(target=self._run, name="ora-rate-snapshot", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error: rate snapshot refresh failed: {e}")
+
+    def _fetch(self, cursor, sql, binds=None):
+        cursor.arraysize = 5000
+        cursor.execute(sql, binds or {})
+        rows = []
+        while True:
+            chunk = cursor.fetchmany()
+            if not chunk:
+                return rows
+            rows.extend(chunk)
+
+    def refresh(self):
+        """Full reload when due, otherwise re-reads the rows changed since the last poll
+        (with the overlap margin)."""
+        with self._refresh_lock, span("db.snapshot_refresh") as attrs, get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(WATERMARK_QUERIES[get_dialect()])
+            watermark = cursor.fetchone()[0]
+            if self._columns is None or time.monotonic() - self._loaded >= self.reload_interval:
+                rows = self._fetch(cursor, SNAPSHOT_QUERY)
+                # Fresh dictionaries drop the values of rows that no longer exist
+                dictionaries = {f"key.{name}": Dictionary() for name in (*TEXT_KEYS, "gp_num")}
+                dictionaries.update({f"raw.{name}": Dictionary() for name in OUTPUT})
+                self._columns = Columns(*self._encode(rows, dictionaries), dictionaries)
+                self._loaded = time.monotonic()
+                attrs["full"] = True
+            elif self._watermark is not None:
+                # Runs even when the watermark did not move: a late commit can carry an
+                # older timestamp
+                rows = self._fetch(cursor, SNAPSHOT_QUERY + CHANGED_SINCE, {"since": _minus(self._watermark, self.overlap)})
+                if rows:
+                    self._columns = self._merge(self._columns, rows)
+            else:
+                rows = []
+            if watermark is not None:
+                self._watermark = watermark
+            attrs["rows"] = len(rows)
+        return len(rows)
+
+    def _encode(self, rows, dictionaries):
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        keys = {
+            name: dictionaries[f"key.{name}"].encode([_text_key(row[SOURCE[name]]) for row in rows])
+            for name in TEXT_KEYS
+        }
+        keys["gp_num"] = dictionaries["key.gp_num"].encode([_number_key(row[SOURCE["gp_num"]]) for row in rows])
+        raw = {
+            name: dictionaries[f"raw.{name}"].encode([row[SOURCE[name]] for row in rows])
+            for name in OUTPUT
+        }
+        numbers = {
+            name: np.array([_number(row[SOURCE[name]]) for row in rows], dtype=np.float64)
+            for name in (*NUMBER_KEYS, "rate")
+        }
+        return ids, keys, raw, numbers
+
+    def _merge(self, columns, rows):
+        """New version with changed rows overwritten in place and new rows appended."""
+        ids, keys, raw, numbers = self._encode(rows, columns.dictionaries)
+        positions = np.array([columns.positions.get(trade_id, -1) for trade_id in ids.tolist()], dtype=np.int64)
+        existing = positions >= 0
+        added = ~existing
+
+        def merged(old, new):
+            array = np.concatenate([old, new[added]])
+            array[positions[existing]] = new[existing]
+            return array
+
+        return Columns(
+            merged(columns.ids, ids),
+            {name: merged(columns.keys[name], keys[name]) for name in keys},
+            {name: merged(columns.raw[name], raw[name]) for name in raw},
+            {name: merged(columns.numbers[name], numbers[name]) for name in numbers},
+            columns.dictionaries,
+        )
+
+    @staticmethod
+    def _code(columns, name, value):
+        key = _number_key(value) if name == "gp_num" else _text_key(value)
+        return columns.dictionaries[f"key.{name}"].code(key)
+
+    def lookup(self, binds, max_rows):
+        """Rows for the compiled request binds (see compile_rate_request), newest first,
+        or None while the snapshot is not loaded."""
+        columns = self._columns
+        if columns is None:
+            return None
+        candidates = None
+        for name in INDEXED:
+            if name not in binds:
+                continue
+            code = self._code(columns, name, binds[name])
+            positions = columns.indexes[name].get(code, EMPTY)
+            candidates = positions if candidates is None else np.intersect1d(candidates, positions, assume_unique=True)
+        if candidates is None:
+            candidates = np.arange(columns.size)
+
+        mask = columns.live[candidates]
+        for name in TEXT_KEYS:
+            if name in binds and name not in INDEXED:
+                code = self._code(columns, name, binds[name])
+                mask &= columns.keys[name][candidates] == (-1 if code is None else code)
+        for name in NUMBER_KEYS:
+            if name in binds:
+                mask &= columns.numbers[name][candidates] == float(binds[name])
+        candidates = candidates[mask]
+        # LAST_UPDATE_TIME DESC NULLS LAST, TRADE_ID DESC, as in RATE_QUERY
+        newest = candidates[np.lexsort((-columns.ids[candidates], -columns.time_rank[candidates]))][:max_rows]
+        return [
+            tuple(columns.dictionaries[f"raw.{name}"].values[columns.raw[name][position]] for name in OUTPUT)
+            for position in newest.tolist()
+        ]
+
+    def stats(self):
+        columns = self._columns
+        if columns is None:
+            return {"rows": 0, "bytes": 0}
+        return {"rows": columns.size, "bytes": columns.nbytes(), "watermark": str(self._watermark)}
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def get_snapshot():
+    """Process-wide rate snapshot when ORA_RATE_SNAPSHOT=1, loaded on first use."""
+    global _snapshot
+    if os.environ.get('ORA_RATE_SNAPSHOT', '0') != '1':
+        return None
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = RateSnapshot().start()
+    return _snapshot
@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import tempfile
+import threading
+from langchain_core.messages import AIMessage, ToolMessage
+from ora_results import run_bounded
+from ora_cache import normalize_question
+from ora_schema import STOPWORDS
+
+# Learned SQL templates.
+# When the agent answers a question, the last successful sql_db_query call holds a
+# working query. Literals in it that also appear in the question are lifted into bind
+# variables and the question is reduced to its shape, e.g.
+#   "what is the rate for acme in usd"  ->  "what is the rate for <<s0>> in <<s1>>"
+# Later questions with the same shape run the stored query directly, without the LLM.
+# At most ORA_TEMPLATE_MAX shapes are kept per namespace; learning a new one beyond that
+# drops the least recently learned.
+
+SLOT = "<<{}>>"
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|(?<=[=<>])\s*-?\d+(?:\.\d+)?\b")
+SLOT_PATTERN = re.compile(r"<<(s\d+)>>")
+# Errors that mean the stored SQL itself is broken (invalid identifier, missing table,
+# ambiguous column, bad syntax or types); anything else, such as a pool timeout, is transient
+SQL_ERROR_PATTERN = re.compile(
+    r"ORA-(00904|00942|00918|00933|00936|00932|01722|01858)\b|no such (column|table)|syntax error")
+
+# Result columns renamed to the keys of the system JSON response
+RESPONSE_COLUMNS = {
+    "HARD_CODED_RATE": "rate",
+    "LAST_UPDATE_USER": "user",
+    "LAST_MODIFIED_USER": "user",
+}
+
+
+def extract_final_query(messages):
+    """Returns the last sql_db_query statement whose tool result was not an error."""
+    calls = {}
+    final_query = None
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                if call["name"] == "sql_db_query":
+                    calls[call["id"]] = call["args"].get("query")
+        elif isinstance(message, ToolMessage) and message.tool_call_id in calls:
+            if not str(message.content).startswith("Error"):
+                final_query = calls[message.tool_call_id]
+    return final_query
+
+
+def _transform(literal, value):
+    if literal == value:
+        return "none"
+    if literal == value.upper():
+        return "upper"
+    if literal == value.lower():
+        return "lower"
+    return None
+
+
+def _is_payload(question):
+    try:
+        return isinstance(json.loads(question), dict)
+    except ValueError:
+        return False
+
+
+def _liftable(question, literal):
+    """Only distinctive values are turned into slots. In free text a short code ('A',
+    'IN', 'TO'), a stopword or a value the question contains twice could be bound to the
+    wrong word of a later question, so those stay literals in the SQL. In a JSON payload
+    every value sits in its own field, so short codes such as countries and sides are
+    lifted as long as they occur once."""
+    if not _is_payload(question) and (len(literal) < 3 or literal.lower() in STOPWORDS):
+        return False
+    pattern = r"(?<!\w)" + re.escape(literal) + r"(?!\w)"
+    return len(re.findall(pattern, question, re.IGNORECASE)) == 1
+
+
+def _find(question, value, taken):
+    for match in re.finditer(r"(?<!\w)" + re.escape(value) + r"(?!\w)", question, re.IGNORECASE):
+        span = match.span()
+        if all(span[1] <= start or span[0] >= end for start, end in taken):
+            return span
+    return None
+
+
+def lift_literals(sql, question):
+    """Turns a concrete query into (template_sql, shape, slots).
+
+    question must already be normalized. Returns None when the statement is not a
+    plain query.
+    """
+    if not re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE):
+        return None
+
+    found = []  # (span in question, transform, words, literal match)
+    taken = []
+    for match in LITERAL_PATTERN.finditer(sql):
+        token = match.group(0)
+        if token.startswith("'"):
+            literal = token[1:-1].replace("''", "'")
+            kind = None
+        else:
+            literal = token.strip()
+            kind = "number"
+        if not _liftable(question, literal):
+            continue
+        span = _find(question, literal, taken)
+        if span is None:
+            continue
+        value = question[span[0]:span[1]]
+        transform = kind or _transform(literal, value)
+        if transform is None:
+            continue
+        taken.append(span)
+        found.append((span, transform, len(value.split()), match))
+
+    # Slots are numbered in question order so the shape reads naturally
+    found.sort(key=lambda item: item[0][0])
+    slots = []
+    names = {}
+    shape = question
+    for index, (span, transform, words, match) in reversed(list(enumerate(found))):
+        name = f"s{index}"
+        names[match.start()] = name
+        shape = shape[:span[0]] + SLOT.format(name) + shape[span[1]:]
+        slots.insert(0, {"name": name, "transform": transform, "words": words})
+
+    def bind(match):
+        name = names.get(match.start())
+        if name is None:
+            return match.group(0)
+        # Keep the whitespace the number pattern swallowed after the operator
+        return match.group(0)[:len(match.group(0)) - len(match.group(0).lstrip())] + f":{name}"
+
+    return LITERAL_PATTERN.sub(bind, sql), shape, slots
+
+
+def _shape_regex(shape, slots):
+    words = {slot["name"]: slot["words"] for slot in slots}
+    pattern = ""
+    position = 0
+    for match in SLOT_PATTERN.finditer(shape):
+        pattern += re.escape(shape[position:match.start()])
+        count = words[match.group(1)]
+        pattern += rf"(?P<{match.group(1)}>[^\s\"]+(?: [^\s\"]+){{{count - 1}}})"
+        position = match.end()
+    pattern += re.escape(shape[position:])
+    return re.compile(pattern)
+
+
+def _bind_value(slot, value):
+    transform = slot["transform"]
+    if transform == "number":
+        return float(value) if "." in value else int(value)
+    if transform == "upper":
+        return value.upper()
+    if transform == "lower":
+        return value.lower()
+    return value
+
+
+def format_table(columns, rows):
+    """Markdown table for the QnA page."""
+    if not rows:
+        return "No results were found."
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    lines += ["| " + " | ".join(str(value) for value in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def format_json(columns, rows):
+    """JSON response in the shape the system prompt asks for."""
+    if not rows:
+        return json.dumps([{"message": "No results found"}])
+    keys = [RESPONSE_COLUMNS.get(column.upper(), column.lower()) for column in columns]
+    return json.dumps([dict(zip(keys, row)) for row in rows], default=str)
+
+
+class TemplateStore:
+
+    def __init__(self, namespace, formatter, path=None):
+        self.namespace = namespace
+        self.formatter = formatter
+        self.path = path or os.environ.get('ORA_TEMPLATE_STORE', '.ora_templates.json')
+        self.max_templates = int(os.environ.get('ORA_TEMPLATE_MAX', 500))
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._patterns = {}
+        self._load(self._read().get(namespace, {}))
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            # Templates are only an optimization; start empty rather than fail to start
+            print(f"Error: ignoring unreadable template store {self.path}: {e}")
+            return {}
+
+    def _save(self, shape, template):
+        """Applies one learned shape (or, with template None, one forgotten shape) to the
+        file and returns the namespace as stored. Other processes and namespaces share the
+        file, so the change is merged into what is on disk instead of writing this
+        process's copy over theirs."""
+        store = self._read()
+        templates = store.get(self.namespace, {})
+        templates.pop(shape, None)
+        if template is not None:
+            # Re-learned shapes move to the end; the oldest are dropped over the limit
+            templates[shape] = template
+            for old in list(templates)[:max(len(templates) - self.max_templates, 0)]:
+                del templates[old]
+        store[self.namespace] = templates
+        # Write a temporary file and swap it in, so concurrent readers and writers in
+        # other processes never see a partially written file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".ora_templates.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(store, f, indent=2)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return templates
+
+    def _load(self, templates):
+        # Swaps in new dicts rather than mutating, so match() can read them without the lock.
+        # Only new or changed shapes are compiled again
+        patterns = {}
+        for shape, template in templates.items():
+            if self._templates.get(shape) == template:
+                patterns[shape] = self._patterns[shape]
+            else:
+                patterns[shape] = _shape_regex(shape, template["slots"])
+        self._templates = templates
+        self._patterns = patterns
+
+    def match(self, msg):
+        """Returns (shape, sql, binds) for the first template the question fits."""
+        question = normalize_question(msg)
+        with self._lock:
+            templates, patterns = self._templates, self._patterns
+        for shape, pattern in patterns.items():
+            found = pattern.fullmatch(question)
+            if found is None:
+                continue
+            template = templates[shape]
+            try:
+                binds = {slot["name"]: _bind_value(slot, found.group(slot["name"])) for slot in template["slots"]}
+            except ValueError:
+                continue
+            return shape, template["sql"], binds
+        return None
+
+    def answer(self, msg):
+        """Runs a matching template and formats its rows, or returns None."""
+        matched = self.match(msg)
+        if matched is None:
+            return None
+        shape, sql, binds = matched
+        try:
+            columns, rows, _ = run_bounded(sql, binds)
+        except Exception as e:
+            if SQL_ERROR_PATTERN.search(str(e)):
+                print(f"Error: template for '{shape}' failed, dropping it: {e}")
+                self.forget(shape)
+            else:
+                print(f"Error: template for '{shape}' could not run, leaving it to the agent: {e}")
+            return None
+        return self.formatter(columns, rows)
+
+    def learn(self, msg, messages):
+        """Stores the agent's final query for this question shape."""
+        sql = extract_final_query(messages)
+        if not sql:
+            return None
+        lifted = lift_literals(sql, normalize_question(msg))
+        if lifted is None:
+            return None
+        template_sql, shape, slots = lifted
+        with self._lock:
+            self._load(self._save(shape, {"sql": template_sql, "slots": slots}))
+        return shape
+
+    def forget(self, shape):
+        with self._lock:
+            self._load(self._save(shape, None))
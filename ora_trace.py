@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Per-request tracing and process-wide latency/token metrics.
+# Each executeQuery/streamQuery call runs inside trace_request(), which gives it a
+# request id and collects span timings for LLM calls, tool calls and database round
+# trips. Finished traces are appended to ORA_TRACE_LOG as JSON lines and folded into
+# the metrics served in Prometheus text format on ORA_METRICS_PORT (/metrics).
+
+_current = contextvars.ContextVar("ora_trace", default=None)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative buckets plus a sliding window of recent samples for quantiles."""
+
+    def __init__(self, window=2048):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        """Prometheus text exposition format."""
+
+        def fmt(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({key[0] for key in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(BUCKETS, histogram.buckets):
+                        lines.append(f"{name}_bucket{fmt(labels, le=bound)} {count}")
+                    lines.append(f"{name}_bucket{fmt(labels, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+                # p50/p95/p99 over the most recent samples
+                lines.append(f"# TYPE {name}_recent summary")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for q in QUANTILES:
+                        lines.append(f"{name}_recent{fmt(labels, quantile=q)} {histogram.quantile(q):.6f}")
+            for name in sorted({key[0] for key in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_log_lock = threading.Lock()
+_server = None
+
+
+class Trace:
+
+    def __init__(self, variant, question):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.variant = variant
+        self.question = question
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.path = None
+        self.status = "ok"
+        self.error = None
+        self.spans = []
+        self.counts = {
+            "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "tool_calls": 0, "db_calls": 0, "rows": 0, "sql_retries": 0,
+        }
+        self._lock = threading.Lock()
+
+    def add_span(self, name, started, duration, attrs):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((started - self.started) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **attrs,
+            })
+        metrics.observe("ora_span_duration_seconds", {"span": name}, duration)
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.counts[key] += value
+
+    def callback(self):
+        return TraceCallbackHandler(self)
+
+    def to_dict(self, duration):
+        return {
+            "request_id": self.request_id,
+            "timestamp": self.timestamp,
+            "variant": self.variant,
+            "question": self.question,
+            "path": self.path,
+            "status": self.status,
+            "error": self.error,
+            "duration_ms": round(duration * 1000, 2),
+            **self.counts,
+            "spans": self.spans,
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+def annotate(path):
+    """Records which path answered the current request (cache, rate_lookup, template, agent)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.path = path
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times a block inside the current request; yields a dict for extra attributes
+    such as row counts."""
+    started = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        duration = time.perf_counter() - started
+        trace = _current.get()
+        if trace is not None:
+            if name.startswith("db."):
+                trace.count("db_calls")
+                trace.count("rows", attrs.get("rows", 0))
+            trace.add_span(name, started, duration, attrs)
+        else:
+            metrics.observe("ora_span_duration_seconds", {"span": name}, duration)
+
+
+@contextmanager
+def trace_request(variant, question):
+    trace = Trace(variant, question)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except GeneratorExit:
+        # A streamed request whose consumer went away
+        trace.status = "cancelled"
+        raise
+    except BaseException as e:
+        trace.status = "error"
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - trace.started
+        labels = {"variant": variant, "path": trace.path or "none"}
+        metrics.observe("ora_request_duration_seconds", labels, duration)
+        metrics.inc("ora_requests_total", {**labels, "status": trace.status})
+        metrics.inc("ora_llm_calls_total", {"variant": variant}, trace.counts["llm_calls"])
+        metrics.inc("ora_llm_tokens_total", {"variant": variant, "kind": "prompt"}, trace.counts["prompt_tokens"])
+        metrics.inc("ora_llm_tokens_total", {"variant": variant, "kind": "completion"}, trace.counts["completion_tokens"])
+        metrics.inc("ora_sql_retries_total", {"variant": variant}, trace.counts["sql_retries"])
+        _write(trace.to_dict(duration))
+
+
+def _write(record):
+    path = os.environ.get('ORA_TRACE_LOG', 'ora_traces.jsonl')
+    if not path:
+        return
+    with _log_lock:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Feeds LLM and tool timings of an agent run into a Trace."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt = usage.get("prompt_tokens", 0)
+        completion = usage.get("completion_tokens", 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt += metadata.get("input_tokens", 0)
+                    completion += metadata.get("output_tokens", 0)
+        self.trace.count("llm_calls")
+        self.trace.count("prompt_tokens", prompt)
+        self.trace.count("completion_tokens", completion)
+        self.trace.add_span("llm", started, time.perf_counter() - started,
+                            {"prompt_tokens": prompt, "completion_tokens": completion})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.trace.add_span("llm", started, time.perf_counter() - started, {"error": str(error)})
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        started, name = started
+        content = str(getattr(output, "content", output))
+        error = content.startswith("Error")
+        if error and name == "sql_db_query":
+            # The agent will rewrite the query and try again
+            self.trace.count("sql_retries")
+        self.trace.count("tool_calls")
+        self.trace.add_span(f"tool.{name}", started, time.perf_counter() - started, {"error": error})
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        started, name = started
+        self.trace.count("tool_calls")
+        self.trace.add_span(f"tool.{name}", started, time.perf_counter() - started, {"error": str(error)})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None):
+    """Serves /metrics on ORA_METRICS_PORT once per process (no-op when unset)."""
+    global _server
+    port = port or os.environ.get('ORA_METRICS_PORT')
+    if not port or _server is not None:
+        return _server
+    with _log_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"Metrics: http://0.0.0.0:{port}/metrics")
+    return _server
@@ -0,0 +1,313 @@
+import re
+from difflib import get_close_matches
+
+# Local SQL validation used in place of the toolkit's LLM-backed sql_db_query_checker.
+# Generated queries are tokenized and checked against the SchemaRegistry built from
+# Table_Relationships before they are sent to the database:
+#   - only a single SELECT/WITH statement is allowed (no DML/DDL)
+#   - tables and columns must exist in Table_Relationships
+#   - joins on key columns must follow a declared relationship, and every table in a
+#     simple query must be joined to the others
+#   - client name, research type, region, execution type, country and currency must be
+#     compared through UPPER(), as SQL_PREFIX asks
+# Problems are returned to the agent as the tool's error, so it rewrites the query
+# without a database round trip or an extra LLM call to a checker.
+
+# Columns SQL_PREFIX says to evaluate with the uppercase function
+UPPER_COLUMNS = {"CLIENT_NAME", "RSCH_TYPE", "REGION", "EXEC_TYPE", "COUNTRY", "CURRENCY"}
+
+FORBIDDEN = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "DROP", "ALTER", "CREATE", "TRUNCATE",
+    "GRANT", "REVOKE", "RENAME", "COMMIT", "ROLLBACK", "EXECUTE", "EXEC", "CALL", "LOCK",
+}
+
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "BETWEEN",
+    "EXISTS", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "ON",
+    "USING", "AS", "GROUP", "BY", "ORDER", "HAVING", "ASC", "DESC", "DISTINCT", "UNIQUE",
+    "UNION", "ALL", "INTERSECT", "MINUS", "EXCEPT", "CASE", "WHEN", "THEN", "ELSE", "END",
+    "FETCH", "FIRST", "NEXT", "ROWS", "ROW", "ONLY", "OFFSET", "LIMIT", "WITH", "TIES",
+    "ROWNUM", "ROWID", "LEVEL", "PRIOR", "CONNECT", "START", "SYSDATE", "SYSTIMESTAMP",
+    "CURRENT_DATE", "CURRENT_TIMESTAMP", "DUAL", "TRUE", "FALSE", "INTERVAL", "DATE",
+    "TIMESTAMP", "YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "NULLS", "LAST",
+    "OVER", "PARTITION", "ESCAPE", "ANY", "SOME", "FOR", "BOTH", "LEADING", "TRAILING",
+    "PERCENT", "KEEP", "DENSE_RANK", "WITHIN",
+}
+
+# FROM preceded by one of these belongs to EXTRACT(... FROM x) or TRIM(... FROM x)
+FROM_FUNCTION_WORDS = {"YEAR", "MONTH", "DAY", "HOUR", "MINUTE", "SECOND", "BOTH", "LEADING", "TRAILING"}
+
+COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"[^\"]+\"|:\w+|\d+(?:\.\d+)?|\w+|<>|!=|<=|>=|\|\||\S")
+COMPARISONS = {"=", "<>", "!=", "LIKE", "IN"}
+
+
+def tokenize(sql):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(COMMENT_PATTERN.sub(" ", sql)):
+        if token.startswith('"'):
+            token = token.strip('"')
+        tokens.append(token)
+    return tokens
+
+
+def _is_literal(token):
+    return token.startswith("'")
+
+
+def _is_name(token):
+    return bool(re.match(r"[A-Za-z_]\w*$", token))
+
+
+class SqlValidator:
+
+    def __init__(self, registry, upper_columns=UPPER_COLUMNS):
+        self.registry = registry
+        self.upper_columns = {column.upper() for column in upper_columns}
+        self.columns = {table: {name.upper() for name, _, _ in columns} for table, columns in registry.tables.items()}
+        self.relationships = set()
+        for left, left_col, right, right_col in registry.relationships:
+            self.relationships.add((left, left_col, right, right_col))
+            self.relationships.add((right, right_col, left, left_col))
+
+    def validate(self, sql):
+        """Returns a list of problems with the query; empty when it may be run."""
+        tokens = tokenize(sql)
+        upper = [token.upper() for token in tokens]
+        problems = self._check_statement(tokens, upper)
+        if problems:
+            return problems
+        aliases, derived = self._tables(tokens, upper, problems)
+        refs = self._column_refs(tokens, upper, aliases, derived, problems)
+        self._check_joins(upper, aliases, refs, problems)
+        self._check_upper(tokens, upper, self._upper_refs(tokens, upper, aliases, derived, refs), problems)
+        return problems
+
+    def _check_statement(self, tokens, upper):
+        if not tokens or upper[0] not in ("SELECT", "WITH"):
+            return ["only a single SELECT statement can be run"]
+        while tokens and tokens[-1] == ";":
+            tokens.pop()
+            upper.pop()
+        if ";" in tokens:
+            return ["only a single statement can be run; remove the ';' between statements"]
+        forbidden = sorted({word for word in upper if word in FORBIDDEN})
+        if forbidden:
+            return [f"the query may not contain {', '.join(forbidden)}; only SELECT statements can be run"]
+        return []
+
+    def _tables(self, tokens, upper, problems):
+        """Maps every alias (and bare table name) in FROM/JOIN clauses to its table.
+        Returns (aliases, derived) where derived holds CTE names and subquery aliases."""
+        derived = set()
+        for index in range(1, len(tokens) - 2):
+            # WITH name AS ( ... ), name AS ( ... )
+            if upper[index - 1] in ("WITH", ",") and upper[index + 1] == "AS" and tokens[index + 2] == "(":
+                derived.add(upper[index])
+
+        aliases = {}
+        for index, word in enumerate(upper):
+            if word == "FROM" and index and (upper[index - 1] in FROM_FUNCTION_WORDS or _is_literal(tokens[index - 1])):
+                continue
+            if word not in ("FROM", "JOIN"):
+                continue
+            position = index + 1
+            while position < len(tokens):
+                if tokens[position] == "(":
+                    # Derived table; its alias follows the closing parenthesis
+                    depth = 0
+                    while position < len(tokens):
+                        depth += {"(": 1, ")": -1}.get(tokens[position], 0)
+                        position += 1
+                        if depth == 0:
+                            break
+                    if position < len(tokens) and upper[position] == "AS":
+                        position += 1
+                    if position < len(tokens) and _is_name(tokens[position]) and upper[position] not in KEYWORDS:
+                        derived.add(upper[position])
+                        position += 1
+                elif position < len(tokens) and _is_name(tokens[position]):
+                    table = upper[position]
+                    position += 1
+                    # OWNER.TABLE
+                    while position + 1 < len(tokens) and tokens[position] == "." and _is_name(tokens[position + 1]):
+                        table = upper[position + 1]
+                        position += 2
+                    if table in self.columns:
+                        aliases[table] = table
+                    elif table not in derived and table != "DUAL":
+                        problems.append(self._unknown_table(table))
+                    if position < len(tokens) and upper[position] == "AS":
+                        position += 1
+                    if position < len(tokens) and _is_name(tokens[position]) and upper[position] not in KEYWORDS:
+                        if table in self.columns:
+                            aliases[upper[position]] = table
+                        else:
+                            derived.add(upper[position])
+                        position += 1
+                if word == "FROM" and position < len(tokens) and tokens[position] == ",":
+                    position += 1
+                    continue
+                break
+        return aliases, derived
+
+    def _unknown_table(self, table):
+        close = get_close_matches(table, self.columns, n=1)
+        hint = f" Did you mean {close[0]}?" if close else ""
+        return f"table {table} is not in Table_Relationships.{hint}"
+
+    def _unknown_column(self, column, tables):
+        known = set().union(*(self.columns[table] for table in tables)) if tables else set()
+        close = get_close_matches(column, known, n=1)
+        hint = f" Did you mean {close[0]}?" if close else ""
+        return f"column {column} does not exist in {', '.join(sorted(tables))}.{hint}"
+
+    def _column_refs(self, tokens, upper, aliases, derived, problems):
+        """Checks every column reference; returns {token index: (alias, table, column)}
+        for qualified references to known tables."""
+        refs = {}
+        qualified = set()
+        for index in range(len(tokens) - 2):
+            if tokens[index + 1] != "." or not _is_name(tokens[index]) or not _is_name(tokens[index + 2]):
+                continue
+            if index and upper[index - 1] in ("FROM", "JOIN"):
+                continue
+            alias, column = upper[index], upper[index + 2]
+            qualified.update((index, index + 2))
+            if alias in derived:
+                continue
+            if alias not in aliases:
+                problems.append(f"{alias}.{column} refers to {alias}, which is not a table or alias in the FROM clause")
+                continue
+            table = aliases[alias]
+            if column not in self.columns[table]:
+                problems.append(self._unknown_column(column, [table]))
+                continue
+            refs[index] = (alias, table, column)
+
+        # Unqualified names are only checked when every source of columns is known
+        if derived or upper.count("SELECT") > 1:
+            return refs
+        tables = set(aliases.values())
+        if not tables:
+            return refs
+        known = set().union(*(self.columns[table] for table in tables))
+        labels = set()
+        for index, token in enumerate(tokens):
+            if index and _is_name(token) and upper[index] not in KEYWORDS:
+                previous = tokens[index - 1]
+                if upper[index - 1] in ("AS", "END") or previous == ")" or _is_literal(previous) or previous == "*" \
+                        or (_is_name(previous) and upper[index - 1] not in KEYWORDS) or previous[0].isdigit():
+                    labels.add(upper[index])
+        for index, token in enumerate(tokens):
+            word = upper[index]
+            if index in qualified or not _is_name(token) or word in KEYWORDS or word in FORBIDDEN:
+                continue
+            if index + 1 < len(tokens) and tokens[index + 1] in ("(", "."):
+                continue
+            if index and tokens[index - 1] == ":":
+                continue
+            if word in known or word in labels or word in aliases or word in self.columns:
+                continue
+            problems.append(self._unknown_column(word, tables))
+        return refs
+
+    def _check_joins(self, upper, aliases, refs, problems):
+        edges = []
+        for index, (alias, table, column) in refs.items():
+            operator = index + 3
+            if operator >= len(upper) or upper[operator] != "=":
+                continue
+            other = refs.get(operator + 1)
+            if other is None or other[0] == alias:
+                continue
+            edges.append((alias, other[0]))
+            other_alias, other_table, other_column = other
+            if other_table == table or not (column.endswith("_ID") and other_column.endswith("_ID")):
+                continue
+            if (table, column, other_table, other_column) not in self.relationships:
+                path = self.registry._path(table, other_table)
+                steps = set(zip(path, path[1:]))
+                known = [
+                    f"{left}.{left_col} = {right}.{right_col}"
+                    for left, left_col, right, right_col in self.registry.relationships
+                    if (left, right) in steps or (right, left) in steps
+                ]
+                problems.append(
+                    f"{alias}.{column} = {other_alias}.{other_column} is not a relationship in Table_Relationships; "
+                    f"join {table} and {other_table} with: {'; '.join(known)}"
+                )
+
+        # Every table of a single SELECT must be joined to the others
+        if upper.count("SELECT") > 1 or "USING" in upper or "NATURAL" in upper:
+            return
+        sources = {}
+        for alias, table in aliases.items():
+            sources.setdefault(table, set()).add(alias)
+        groups = {alias: alias for alias in aliases}
+
+        def find(alias):
+            while groups[alias] != alias:
+                alias = groups[alias]
+            return alias
+
+        for aliases_of_table in sources.values():
+            first = next(iter(aliases_of_table))
+            for alias in aliases_of_table:
+                groups[find(alias)] = find(first)
+        for left, right in edges:
+            groups[find(left)] = find(right)
+        if len({find(alias) for alias in aliases}) > 1:
+            problems.append(
+                f"the tables {', '.join(sorted(sources))} are not all joined to each other; "
+                f"add join conditions from Table_Relationships"
+            )
+
+    def _upper_refs(self, tokens, upper, aliases, derived, refs):
+        """[(start, end, name)] for the references to UPPER_COLUMNS: the qualified ones,
+        plus unqualified names when a single SELECT reads from one table."""
+        found = [
+            (index, index + 2, f"{alias}.{column}")
+            for index, (alias, table, column) in refs.items() if column in self.upper_columns
+        ]
+        tables = set(aliases.values())
+        if derived or upper.count("SELECT") > 1 or len(tables) != 1:
+            return found
+        columns = self.columns[tables.pop()] & self.upper_columns
+        for index, word in enumerate(upper):
+            if word not in columns or (index and tokens[index - 1] in (".", "AS")):
+                continue
+            if index + 1 < len(tokens) and tokens[index + 1] in ("(", "."):
+                continue
+            found.append((index, index, word))
+        return found
+
+    def _check_upper(self, tokens, upper, refs, problems):
+        for start, end, name in refs:
+            wrapped = start >= 2 and tokens[start - 1] == "(" and upper[start - 2] == "UPPER" \
+                and end + 1 < len(tokens) and tokens[end + 1] == ")"
+            if wrapped:
+                start, end = start - 2, end + 1
+            # column = 'x', column IN ('x', ...), column LIKE 'x', or 'x' = column
+            literals = []
+            position = end + 1
+            if position < len(upper) and upper[position] == "NOT":
+                position += 1
+            if position < len(upper) and upper[position] in COMPARISONS:
+                position += 1
+                if position < len(tokens) and tokens[position] == "(":
+                    position += 1
+                    while position < len(tokens) and tokens[position] != ")":
+                        if _is_literal(tokens[position]):
+                            literals.append(tokens[position])
+                        position += 1
+                elif position < len(tokens) and _is_literal(tokens[position]):
+                    literals.append(tokens[position])
+            elif start >= 2 and upper[start - 1] in COMPARISONS and _is_literal(tokens[start - 2]):
+                literals.append(tokens[start - 2])
+            if not literals:
+                continue
+            if not wrapped:
+                problems.append(f"compare {name} as UPPER({name}) with an uppercase value")
+            elif any(literal != literal.upper() for literal in literals):
+                problems.append(f"UPPER({name}) is compared with a value that is not uppercase")